@@ -0,0 +1,210 @@
+"""Micro-benchmark de los endpoints calientes sobre bases SQLite sembradas.
+
+Siembra una base por tamaño (ahorros sintéticos y un pool grande de retos con el
+formato de data/retos.json), levanta la app con create_app en el mismo proceso y
+mide cada handler a través de ASGI, sin red. La caché de lecturas se desactiva por
+defecto para medir el trabajo real de cada handler.
+
+Los resultados salen en JSON; con --baseline se comparan contra una corrida anterior
+y el proceso termina con código 1 si algún caso se volvió más lento que el umbral.
+
+Uso (desde backend/, requiere httpx):
+    python benchmarks/bench_endpoints.py --sizes 10000,100000,1000000 --output bench.json
+    python benchmarks/bench_endpoints.py --sizes 10000 --baseline bench.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+from sqlalchemy import delete, insert, update  # noqa: E402
+
+import main  # noqa: E402
+
+RETOS_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "retos.json")
+LOTE_SIEMBRA = 50_000
+
+
+async def _sin_preparacion(estado):
+    pass
+
+
+async def _liberar_retos_activados(estado):
+    """Devolver al pool los retos activados por el benchmark para que cada activación sea real"""
+    async with estado.SessionLocal() as db:
+        await db.execute(update(main.Reto).where(main.Reto.date >= datetime.now() - timedelta(days=1)).values(date=None))
+        await db.execute(delete(main.RetoSchedule))
+        await db.commit()
+
+
+def casos(mitad: datetime):
+    """(nombre, método, ruta, preparación sin medir antes de cada iteración)"""
+    return [
+        ("get_estadisticas", "GET", "/estadisticas", _sin_preparacion),
+        ("get_objetivos", "GET", "/objetivos", _sin_preparacion),
+        ("get_retos", "GET", "/retos", _sin_preparacion),
+        ("get_reto_actual", "GET", "/retos/actual", _sin_preparacion),
+        ("get_ahorros", "GET", "/ahorros?limit=100", _sin_preparacion),
+        ("get_ahorros_rango", "GET", f"/ahorros?limit=100&from={mitad.isoformat()}", _sin_preparacion),
+        ("activar_reto_aleatorio", "POST", "/retos/activar", _liberar_retos_activados),
+    ]
+
+
+def _plantillas_retos():
+    with open(RETOS_JSON, encoding="utf-8") as archivo:
+        datos = json.load(archivo)
+    return datos["retos"], datos.get("penitencias", [])
+
+
+async def sembrar(estado, filas: int, retos: int, inicio: datetime):
+    """Ahorros cada pocos minutos durante el último año y un pool de retos (10% ya usados)"""
+    plantillas, penitencias = _plantillas_retos()
+    paso = timedelta(seconds=max(1, int(365 * 86400 / max(filas, 1))))
+    async with estado.engine.begin() as conn:
+        await conn.execute(insert(main.Monto), [{"amount": 10_000.0, "user_id": 1}, {"amount": 20_000.0, "user_id": 2}])
+        for desde in range(0, filas, LOTE_SIEMBRA):
+            await conn.execute(insert(main.Ahorro), [
+                {"user_id": 1 + i % 2, "monto_id": 1 + i % 2, "amount": 10_000.0 * (1 + i % 2), "date": inicio + paso * i}
+                for i in range(desde, min(filas, desde + LOTE_SIEMBRA))
+            ])
+        usados = retos // 10
+        await conn.execute(insert(main.Reto), [
+            {
+                "description": f"{plantillas[i % len(plantillas)]['descripcion']} #{i}",
+                "tipo": plantillas[i % len(plantillas)]["tipo"],
+                # Los primeros quedan en el historial, activados hace más de 24 horas
+                "date": inicio + timedelta(days=i % 365) if i < usados else None,
+                "completed_user1": i < usados,
+                "completed_user2": i < usados and i % 3 != 0,
+                "penitencia_applied": False,
+            }
+            for i in range(retos)
+        ])
+        if penitencias:
+            await conn.execute(insert(main.Penitencia), [{"description": texto} for texto in penitencias])
+    # Totales y objetivos al día con lo sembrado
+    await main.preparar_base_de_datos(estado.engine)
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def medir_tamano(filas: int, retos: int, directorio: str, iteraciones: int, calentamiento: int, con_cache: bool):
+    ruta = os.path.join(directorio, f"ahorros-{filas}-retos-{retos}.db")
+    sembrada = os.path.exists(ruta)
+    settings = main.Settings(
+        database_url=f"sqlite:///{ruta}",
+        scheduler_mode="off",
+        cache_backend="memory",
+        # Sin entradas, cada lectura va a la base de datos
+        cache_max_entries=main.CACHE_MAX_ENTRIES if con_cache else 0,
+    )
+    app = main.create_app(settings)
+    estado = app.state.estado
+    # ASGITransport no ejecuta el lifespan: se arranca a mano
+    await main.iniciar_servidor(estado)
+    inicio = datetime.utcnow() - timedelta(days=365)
+    if not sembrada:
+        t0 = time.perf_counter()
+        await sembrar(estado, filas, retos, inicio)
+        print(f"🌱 {filas} ahorros y {retos} retos sembrados en {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    resultados = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for nombre, metodo, ruta_http, preparar in casos(inicio + timedelta(days=182)):
+                tiempos = []
+                for i in range(calentamiento + iteraciones):
+                    await preparar(estado)
+                    t0 = time.perf_counter()
+                    respuesta = await client.request(metodo, ruta_http)
+                    transcurrido = time.perf_counter() - t0
+                    if respuesta.status_code >= 400:
+                        raise RuntimeError(f"{nombre}: HTTP {respuesta.status_code} {respuesta.text[:200]}")
+                    if i >= calentamiento:
+                        tiempos.append(transcurrido)
+                resultados.append({
+                    "caso": nombre,
+                    "ahorros": filas,
+                    "retos": retos,
+                    "iteraciones": iteraciones,
+                    "p50_ms": round(statistics.median(tiempos) * 1000, 3),
+                    "p95_ms": round(percentil(tiempos, 0.95) * 1000, 3),
+                    "media_ms": round(statistics.fmean(tiempos) * 1000, 3),
+                })
+            await _liberar_retos_activados(estado)
+    finally:
+        await main.detener_servidor(estado)
+    return resultados
+
+
+def comparar(resultados, baseline, umbral: float):
+    """Casos cuyo p50 supera el de la corrida base en más del umbral (fracción)"""
+    base = {(r["caso"], r["ahorros"], r["retos"]): r for r in baseline["resultados"]}
+    regresiones = []
+    for r in resultados:
+        anterior = base.get((r["caso"], r["ahorros"], r["retos"]))
+        if anterior and r["p50_ms"] > anterior["p50_ms"] * (1 + umbral):
+            regresiones.append({
+                "caso": r["caso"],
+                "ahorros": r["ahorros"],
+                "antes_p50_ms": anterior["p50_ms"],
+                "ahora_p50_ms": r["p50_ms"],
+                "cambio": round(r["p50_ms"] / anterior["p50_ms"] - 1, 3),
+            })
+    return regresiones
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Cantidades de ahorros separadas por coma")
+    parser.add_argument("--retos", type=int, default=5000, help="Tamaño del pool de retos")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--data-dir", default=None, help="Dónde guardar (y reutilizar) las bases sembradas")
+    parser.add_argument("--cache", action="store_true", help="Medir con la caché de lecturas activa")
+    parser.add_argument("--output", help="Guardar los resultados en este archivo JSON")
+    parser.add_argument("--baseline", help="Resultados JSON de una corrida anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Regresión tolerada sobre el p50 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    directorio = args.data_dir or tempfile.mkdtemp(prefix="ahorro-bench-")
+    os.makedirs(directorio, exist_ok=True)
+
+    resultados = []
+    for filas in (int(valor) for valor in args.sizes.split(",") if valor.strip()):
+        resultados += asyncio.run(medir_tamano(filas, args.retos, directorio, args.iterations, args.warmup, args.cache))
+
+    salida = {
+        "fecha": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cache": args.cache,
+        "resultados": resultados,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as archivo:
+            salida["regresiones"] = comparar(resultados, json.load(archivo), args.threshold)
+        salida["umbral"] = args.threshold
+
+    texto = json.dumps(salida, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+    print(texto)
+
+    if salida.get("regresiones"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
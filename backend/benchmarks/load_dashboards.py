@@ -0,0 +1,239 @@
+"""Carga de punta a punta: N pestañas del dashboard contra un uvicorn local.
+
+Cada pestaña repite lo que hacían los componentes cuando consultaban por polling:
+Estadisticas.tsx pide /estadisticas sin pausa, Objetivos.tsx pide /objetivos cada 3 s y
+Retos.tsx recorre /retos, /retos/actual, /retos/disponibles, /retos/proximo y los dos
+usuarios. Mientras tanto cada usuario registra un ahorro de vez en cuando (POST /ahorros).
+Con SSE el frontend ya no consulta así, de modo que esta mezcla es el peor caso.
+
+Reporta por endpoint p50/p95/p99, peticiones por segundo y la tasa de errores
+"database is locked" (el servidor los devuelve como 503).
+
+Uso (desde backend/, requiere httpx):
+    python benchmarks/load_dashboards.py --tabs 20 --seconds 30              # levanta su propio uvicorn
+    python benchmarks/load_dashboards.py --tabs 20 --workers 4 --cache-backend redis --json
+    python benchmarks/load_dashboards.py --url http://127.0.0.1:8000 --tabs 50   # servidor ya corriendo
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+RETOS_ENDPOINTS = ["/retos", "/retos/actual", "/retos/disponibles", "/retos/proximo", "/users/1", "/users/2"]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class Registro:
+    """Latencias y errores agrupados por endpoint"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.locked = defaultdict(int)
+        self.errores = defaultdict(lambda: defaultdict(int))
+
+    async def pedir(self, client: httpx.AsyncClient, metodo: str, ruta: str, **kwargs):
+        nombre = f"{metodo} {ruta}"
+        t0 = time.perf_counter()
+        try:
+            respuesta = await client.request(metodo, ruta, **kwargs)
+        except httpx.HTTPError as exc:
+            self.errores[nombre][type(exc).__name__] += 1
+            return None
+        transcurrido = time.perf_counter() - t0
+        if respuesta.status_code == 503 and "database is locked" in respuesta.text:
+            self.locked[nombre] += 1
+        elif respuesta.status_code >= 400:
+            self.errores[nombre][str(respuesta.status_code)] += 1
+        else:
+            self.latencias[nombre].append(transcurrido)
+        return respuesta
+
+    def resumen(self, segundos: float):
+        filas = []
+        for nombre in sorted(set(self.latencias) | set(self.locked) | set(self.errores)):
+            latencias = self.latencias[nombre]
+            errores = dict(self.errores[nombre])
+            total = len(latencias) + self.locked[nombre] + sum(errores.values())
+            filas.append({
+                "endpoint": nombre,
+                "peticiones": total,
+                "por_segundo": round(total / segundos, 1),
+                "p50_ms": round(statistics.median(latencias) * 1000, 2) if latencias else None,
+                "p95_ms": round(percentil(latencias, 0.95) * 1000, 2),
+                "p99_ms": round(percentil(latencias, 0.99) * 1000, 2),
+                "locked": self.locked[nombre],
+                "tasa_locked": round(self.locked[nombre] / total, 4) if total else 0.0,
+                # Código HTTP (o excepción del cliente) -> cantidad
+                "otros_errores": errores,
+            })
+        return filas
+
+
+async def _pausa(segundos: float, fin: float):
+    await asyncio.sleep(min(segundos, max(0.0, fin - time.perf_counter())))
+
+
+async def pestana(client, registro: Registro, fin: float, args):
+    async def estadisticas():
+        while time.perf_counter() < fin:
+            await registro.pedir(client, "GET", "/estadisticas")
+            await _pausa(args.estadisticas_interval, fin)
+
+    async def objetivos():
+        while time.perf_counter() < fin:
+            await registro.pedir(client, "GET", "/objetivos")
+            await _pausa(args.objetivos_interval, fin)
+
+    async def retos():
+        while time.perf_counter() < fin:
+            for ruta in RETOS_ENDPOINTS:
+                await registro.pedir(client, "GET", ruta)
+            await _pausa(args.retos_interval, fin)
+
+    # Desfasar las pestañas para que no arranquen todas en el mismo instante
+    await asyncio.sleep(random.uniform(0, 0.5))
+    await asyncio.gather(estadisticas(), objetivos(), retos())
+
+
+async def usuario(client, registro: Registro, fin: float, user_id: int, intervalo: float):
+    while time.perf_counter() < fin:
+        await _pausa(random.expovariate(1 / intervalo), fin)
+        if time.perf_counter() >= fin:
+            break
+        await registro.pedir(client, "POST", "/ahorros", json={"user_id": user_id, "monto_id": 1, "amount": 10_000.0})
+
+
+async def correr(url: str, args) -> dict:
+    registro = Registro()
+    limites = httpx.Limits(max_connections=args.tabs * 3 + 4, max_keepalive_connections=args.tabs * 3 + 4)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=args.timeout) as client:
+        inicio = time.perf_counter()
+        fin = inicio + args.seconds
+        await asyncio.gather(
+            *(pestana(client, registro, fin, args) for _ in range(args.tabs)),
+            *(usuario(client, registro, fin, user_id, args.ahorro_interval) for user_id in (1, 2)),
+        )
+        duracion = time.perf_counter() - inicio
+
+    endpoints = registro.resumen(duracion)
+    total = sum(e["peticiones"] for e in endpoints)
+    locked = sum(e["locked"] for e in endpoints)
+    return {
+        "url": url,
+        "pestanas": args.tabs,
+        "segundos": round(duracion, 2),
+        "peticiones_por_segundo": round(total / duracion, 1),
+        "tasa_locked": round(locked / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_uvicorn(workers: int, database_url: str, cache_backend: str, cache_url: str):
+    """uvicorn con main:app sobre una base propia; devuelve (proceso, url)"""
+    if workers > 1 and cache_backend != "redis":
+        # Con memory cada worker llena su propia caché: los aciertos no son los de un despliegue real
+        print(
+            f"⚠️  --workers {workers} con CACHE_BACKEND={cache_backend}: cada worker tiene su propia caché; "
+            "usa --cache-backend redis para medir la caché compartida",
+            file=sys.stderr,
+        )
+    puerto = _puerto_libre()
+    entorno = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        SCHEDULER_MODE="leader" if workers > 1 else "local",
+        CACHE_BACKEND=cache_backend,
+        CACHE_URL=cache_url,
+    )
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND, env=entorno, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+        try:
+            httpx.get(f"{url}/", timeout=1).raise_for_status()
+            return proceso, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("uvicorn no respondió a tiempo")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Servidor ya corriendo; si se omite se levanta uno local")
+    parser.add_argument("--workers", type=int, default=1, help="Workers del uvicorn que levanta el script")
+    parser.add_argument("--database-url", help="Base para el uvicorn local (default: SQLite temporal)")
+    parser.add_argument("--cache-backend", default=os.getenv("CACHE_BACKEND", "memory"), choices=["memory", "redis"],
+                        help="CACHE_BACKEND del uvicorn local; con --workers > 1 usa redis")
+    parser.add_argument("--cache-url", default=os.getenv("CACHE_URL", "redis://localhost:6379/0"), help="CACHE_URL del uvicorn local")
+    parser.add_argument("--tabs", type=int, default=10, help="Pestañas de dashboard simultáneas")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--estadisticas-interval", type=float, default=0.0)
+    parser.add_argument("--objetivos-interval", type=float, default=3.0)
+    parser.add_argument("--retos-interval", type=float, default=3.0)
+    parser.add_argument("--ahorro-interval", type=float, default=5.0, help="Segundos promedio entre ahorros de cada usuario")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados como JSON")
+    args = parser.parse_args()
+
+    proceso = None
+    url = args.url
+    if not url:
+        database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='ahorro-load-')}/load.db"
+        proceso, url = levantar_uvicorn(args.workers, database_url, args.cache_backend, args.cache_url)
+    try:
+        # Usuarios y objetivos (idempotente)
+        httpx.post(f"{url}/init", timeout=args.timeout).raise_for_status()
+        resultado = asyncio.run(correr(url, args))
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+
+    print(
+        f"{resultado['pestanas']} pestañas, {resultado['segundos']} s: "
+        f"{resultado['peticiones_por_segundo']} peticiones/s, locked {resultado['tasa_locked']:.2%}"
+    )
+    for e in resultado["endpoints"]:
+        print(
+            f"{e['endpoint']:>22}: {e['por_segundo']:>7} req/s  "
+            f"p50 {e['p50_ms']} ms  p95 {e['p95_ms']} ms  p99 {e['p99_ms']} ms  "
+            f"locked {e['locked']} ({e['tasa_locked']:.2%})  otros errores {e['otros_errores'] or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
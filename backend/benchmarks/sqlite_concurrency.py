@@ -0,0 +1,132 @@
+"""Benchmark de concurrencia lectura/escritura con y sin el perfil SQLite de main.py.
+
+Simula la carga de los dashboards: varias tareas lectoras consultan ahorros y
+totales mientras una tarea escritora registra ahorros (insert + totales + commit),
+todo sobre el engine async (aiosqlite, con su pool) que crea la API.
+Compara los defaults de SQLite (journal DELETE, synchronous FULL) contra
+SQLITE_PRAGMAS (WAL, busy_timeout, mmap, cache).
+
+Uso (desde backend/):
+    python benchmarks/sqlite_concurrency.py --readers 8 --seconds 5 --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import insert, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+import main  # noqa: E402
+
+PERFILES = {
+    "default": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    "tuned": main.SQLITE_PRAGMAS,
+}
+
+
+async def sembrar(engine, filas: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(main.Base.metadata.create_all)
+        inicio = datetime.utcnow() - timedelta(days=365)
+        await conn.execute(insert(main.Ahorro), [
+            {"user_id": 1 + i % 2, "monto_id": 1, "amount": 10_000.0, "date": inicio + timedelta(minutes=i)}
+            for i in range(filas)
+        ])
+    async with async_sessionmaker(engine)() as db:
+        await main._reconstruir_totales(db)
+        await db.commit()
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def correr(perfil: str, lectores: int, segundos: float, filas: int, directorio: str) -> dict:
+    # Mismo engine y pool que la API; solo cambia el perfil de PRAGMAs
+    engine = main.crear_engine(f"sqlite:///{os.path.join(directorio, f'{perfil}.db')}", PERFILES[perfil])
+    await sembrar(engine, filas)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    fin = time.perf_counter() + segundos
+    lecturas, escrituras, bloqueos = [], [], {"lectura": 0, "escritura": 0}
+
+    async def lector():
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            try:
+                async with Session() as db:
+                    await main._total_periodo(db, *main.PERIODO_HISTORICO)
+                    await db.execute(text("SELECT id, amount, date FROM ahorros ORDER BY date DESC, id DESC LIMIT 100"))
+                lecturas.append(time.perf_counter() - t0)
+            except OperationalError:
+                bloqueos["lectura"] += 1
+
+    async def escritor():
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            try:
+                async with Session() as db:
+                    ahora = datetime.utcnow()
+                    db.add(main.Ahorro(user_id=1, monto_id=1, amount=5_000.0, date=ahora))
+                    await main._acumular_totales(db, [(1, ahora, 5_000.0)])
+                    await db.commit()
+                escrituras.append(time.perf_counter() - t0)
+            except OperationalError:
+                bloqueos["escritura"] += 1
+
+    await asyncio.gather(*[lector() for _ in range(lectores)], escritor())
+
+    async with engine.connect() as conn:
+        modo = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+    await engine.dispose()
+
+    return {
+        "perfil": perfil,
+        "journal_mode": modo,
+        "lecturas_por_segundo": round(len(lecturas) / segundos, 1),
+        "escrituras_por_segundo": round(len(escrituras) / segundos, 1),
+        "lectura_p50_ms": round(statistics.median(lecturas) * 1000, 2) if lecturas else None,
+        "lectura_p95_ms": round(percentil(lecturas, 0.95) * 1000, 2),
+        "escritura_p95_ms": round(percentil(escrituras, 0.95) * 1000, 2),
+        "errores_locked": bloqueos,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados como JSON")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="ahorro-bench-")
+    resultados = [asyncio.run(correr(perfil, args.readers, args.seconds, args.rows, directorio)) for perfil in PERFILES]
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    for r in resultados:
+        print(
+            f"{r['perfil']:>8} ({r['journal_mode']}): "
+            f"{r['lecturas_por_segundo']} lecturas/s (p95 {r['lectura_p95_ms']} ms), "
+            f"{r['escrituras_por_segundo']} escrituras/s (p95 {r['escritura_p95_ms']} ms), "
+            f"locked: {r['errores_locked']}"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,23 +1,191 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, extract, func
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import cast, event, delete, exists, insert, inspect, select, text, update, Column, Integer, String, Float, Boolean, Date, DateTime, Index, UniqueConstraint, extract, func
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, date, timedelta
-from sqlalchemy import and_, or_, func
-from random import choice
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta, timezone
+from sqlalchemy import and_, or_, func, tuple_
+from random import choice, choices, randrange, shuffle
+import asyncio
+import base64
+import contextvars
+import csv
+import hashlib
+import io
+import itertools
+import json
+import math
 import os
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+import socket
+import threading
+import time
+import uuid
 import pytz
 
 
 # Database setup
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ahorro.db")
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Conexiones que el pool mantiene abiertas (con sus PRAGMAs ya aplicados) y extra en picos
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Scheduler de retos: "local" (en cada proceso), "leader" (un solo proceso entre
+# todos los workers, con job store en la BD y lease renovable) u "off" (nunca)
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "local").strip().lower()
+SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", "60"))
+# Retraso máximo con el que todavía se ejecuta una activación perdida (servidor caído a las 00:01)
+SCHEDULER_MISFIRE_GRACE_HORAS = float(os.getenv("SCHEDULER_MISFIRE_GRACE_HORAS", "72"))
+# Varias ejecuciones perdidas del mismo job se juntan en una sola
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "true").strip().lower() in ("1", "true", "yes")
+
+# Caché de lecturas: "memory" (LRU del proceso), "redis" (compartida entre workers,
+# requiere el paquete redis y CACHE_URL) o "fake" (cliente Redis en memoria, para pruebas)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").strip().lower()
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Modo de sorteo de /penitencias/random si no se pide otro: uniforme | ponderado | sin_repetir
+PENITENCIA_MODO = os.getenv("PENITENCIA_MODO", "uniforme").strip().lower()
+
+# Perfil SQL por petición (opcional): cuenta consultas y tiempo de BD en Server-Timing y
+# registra con su plan de ejecución las que superan SQL_SLOW_MS
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").strip().lower() in ("1", "true", "yes")
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+
+# Segundos que dura cada stream de /events antes de que el servidor lo cierre: un apagado
+# (deploy, --reload) espera a lo sumo esto, y el navegador se reconecta solo
+SSE_MAX_SEGUNDOS = float(os.getenv("SSE_MAX_SEGUNDOS", "30"))
+SSE_KEEPALIVE_SEGUNDOS = 15
+
+# Filas por transacción en las cargas masivas (/ahorros/bulk, /montos/bulk)
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+# Periodos máximos de /estadisticas/series (granularity=day sobre siglos no cabe en una respuesta)
+SERIES_MAX_PERIODOS = int(os.getenv("SERIES_MAX_PERIODOS", "1000"))
+
+# Filas leídas del cursor por cada bloque enviado en /export/*
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+
+# Perfil de conexión SQLite (una variable vacía deja el valor por defecto de SQLite)
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),  # negativo = KiB
+}
+
+_PRAGMAS_PERMITIDOS = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"},
+}
+
+def configurar_sqlite(dbapi_connection, pragmas: dict):
+    """Aplicar el perfil de PRAGMAs a una conexión nueva del pool"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for nombre, valor in pragmas.items():
+            valor = str(valor).strip().upper()
+            if not valor:
+                continue
+            permitidos = _PRAGMAS_PERMITIDOS.get(nombre)
+            if permitidos is not None and valor not in permitidos:
+                raise ValueError(f"Valor inválido para PRAGMA {nombre}: {valor}")
+            if permitidos is None:
+                valor = str(int(valor))
+            cursor.execute(f"PRAGMA {nombre}={valor}")
+    finally:
+        cursor.close()
+
+def _url_async(url: str) -> str:
+    """Driver async para DATABASE_URL: aiosqlite para SQLite, asyncpg para PostgreSQL"""
+    drivers = {
+        "sqlite://": "sqlite+aiosqlite://",
+        "postgresql://": "postgresql+asyncpg://",
+        "postgres://": "postgresql+asyncpg://",
+    }
+    for prefijo, driver in drivers.items():
+        if url.startswith(prefijo):
+            return driver + url[len(prefijo):]
+    return url
+
+def _url_sync(url: str) -> str:
+    """Driver síncrono para DATABASE_URL (job store de APScheduler)"""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+class Settings(BaseModel):
+    """Configuración de una instancia de la API; por defecto, la de las variables de entorno"""
+    database_url: str = SQLALCHEMY_DATABASE_URL
+    sqlite_pragmas: Dict[str, str] = SQLITE_PRAGMAS
+    db_pool_size: int = DB_POOL_SIZE
+    db_max_overflow: int = DB_MAX_OVERFLOW
+    scheduler_mode: str = SCHEDULER_MODE
+    cache_backend: str = CACHE_BACKEND
+    cache_url: str = CACHE_URL
+    cache_max_entries: int = CACHE_MAX_ENTRIES
+    sql_profile: bool = SQL_PROFILE
+    sql_slow_ms: float = SQL_SLOW_MS
+
+def _conexion_prestada(dbapi_connection, registro, proxy):
+    registro.info["prestada_en"] = time.perf_counter()
+
+def _begin_sqlite(conn):
+    """BEGIN explícito para las conexiones con execution_options(sqlite_begin=...).
+
+    pysqlite solo abre la transacción antes del primer INSERT/UPDATE/DELETE; con
+    sqlite_begin="IMMEDIATE" se toma el candado de escritura desde el comienzo.
+    """
+    modo = conn.get_execution_options().get("sqlite_begin")
+    if modo:
+        conn.exec_driver_sql(f"BEGIN {modo}")
+
+def crear_engine(database_url: str, sqlite_pragmas: dict, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> AsyncEngine:
+    """Engine async con pool de conexiones; en SQLite cada conexión nueva recibe el perfil de PRAGMAs"""
+    url = _url_async(database_url)
+    if ":memory:" in url or "mode=memory" in url:
+        # Cada conexión nueva a :memory: sería una base vacía: todas las sesiones comparten una
+        opciones = {"poolclass": StaticPool}
+    else:
+        # aiosqlite usa NullPool por defecto con archivos: cada sesión abriría una conexión y
+        # repetiría los PRAGMAs. Con un pool de verdad se reutilizan, igual que en PostgreSQL
+        opciones = {"poolclass": AsyncAdaptedQueuePool, "pool_size": pool_size, "max_overflow": max_overflow}
+    engine = create_async_engine(url, **opciones)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", lambda dbapi_connection, _: configurar_sqlite(dbapi_connection, sqlite_pragmas))
+        event.listen(engine.sync_engine, "begin", _begin_sqlite)
+    return engine
+
+def configurar_base_de_datos(estado: "EstadoApp"):
+    """Crear el engine async y la fábrica de sesiones de una instancia de la app"""
+    settings = estado.settings
+    estado.engine = crear_engine(settings.database_url, settings.sqlite_pragmas, settings.db_pool_size, settings.db_max_overflow)
+    checkout_pool = estado.metricas.checkout_pool
+
+    def conexion_devuelta(dbapi_connection, registro):
+        prestada_en = registro.info.pop("prestada_en", None)
+        if prestada_en is not None:
+            checkout_pool.observar(time.perf_counter() - prestada_en)
+
+    event.listen(estado.engine.sync_engine.pool, "checkout", _conexion_prestada)
+    event.listen(estado.engine.sync_engine.pool, "checkin", conexion_devuelta)
+    # expire_on_commit=False: en modo async no hay lazy loads después del commit.
+    # info: cada sesión sabe a qué instancia pertenece (ver _estado_de)
+    estado.SessionLocal = async_sessionmaker(estado.engine, autoflush=False, expire_on_commit=False, info={"estado": estado})
+
 Base = declarative_base()
 
 # Database Models
@@ -37,6 +205,10 @@ class Monto(Base):
 
 class Ahorro(Base):
     __tablename__ = "ahorros"
+    __table_args__ = (
+        Index("ix_ahorros_date_id", "date", "id"),
+        Index("ix_ahorros_user_id_date_id", "user_id", "date", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
     monto_id = Column(Integer)
@@ -52,6 +224,11 @@ class Objetivo(Base):
 
 class Reto(Base):
     __tablename__ = "retos"
+    __table_args__ = (
+        Index("ix_retos_date", "date"),
+        # Índice parcial: solo el pool de retos disponibles
+        Index("ix_retos_disponibles", "id", sqlite_where=text("date IS NULL"), postgresql_where=text("date IS NULL")),
+    )
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String)
     tipo = Column(String, default="ahorro")  # "ahorro" o "gratis"
@@ -64,16 +241,208 @@ class Penitencia(Base):
     __tablename__ = "penitencias"
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String, nullable=False)
+    weight = Column(Float, nullable=False, default=1.0, server_default="1")  # Probabilidad relativa en el modo ponderado
 
 class RetoSchedule(Base):
-    """Tabla para trackear cuándo se activó el último reto automático"""
+    """Tabla para trackear cuándo se activó cada reto (automático o manual)"""
     __tablename__ = "reto_schedule"
+    __table_args__ = (
+        Index("ix_reto_schedule_tipo_fecha", "activation_type", "last_activation_date"),
+        # Una sola activación por día: la inserción hace de candado entre workers
+        Index("uq_reto_schedule_activation_day", "activation_day", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     last_activation_date = Column(DateTime, nullable=False)
-    activation_type = Column(String)  # "day_1" o "day_15"
+    activation_type = Column(String)  # "day_1", "day_15" o "manual"
+    activation_day = Column(Date)
+
+class AhorroTotal(Base):
+    """Totales acumulados de ahorros por mes y usuario, mantenidos al insertar cada ahorro"""
+    __tablename__ = "ahorro_totales"
+    __table_args__ = (UniqueConstraint("year", "month", "user_id", name="uq_ahorro_totales_periodo"),)
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False)   # 0 = histórico
+    month = Column(Integer, nullable=False)  # 0 = histórico
+    user_id = Column(Integer, nullable=False)  # 0 = total de la pareja
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+class SchedulerLease(Base):
+    """Lease del proceso que ejecuta el scheduler cuando corren varios workers"""
+    __tablename__ = "scheduler_leases"
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class SchemaMigration(Base):
+    """Migraciones de esquema ya aplicadas a esta base de datos"""
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class DataVersion(Base):
+    """Versión de cada tabla, incrementada por triggers en la misma transacción que la modifica (ETag y caché de lecturas)"""
+    __tablename__ = "data_versions"
+    tabla = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Tablas que consultan las lecturas con ETag o caché; cada una tiene triggers que incrementan su
+# fila de data_versions. Una tabla nueva necesita su migración con _triggers_de_version
+TABLAS_CON_VERSION = ("users", "montos", "ahorros", "objetivos", "retos", "penitencias", "reto_schedule", "ahorro_totales")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Metas de ahorro de la pareja
+OBJETIVOS_AMOUNTS = [1_000_000, 2_000_000, 3_000_000, 5_000_000, 7_000_000, 12_000_000, 20_000_000]
+
+# Claves especiales de ahorro_totales
+TOTAL_PAREJA = 0
+PERIODO_HISTORICO = (0, 0)
+
+# ============================================
+# MIGRACIONES DE ESQUEMA
+# ============================================
+# Clave del advisory lock de PostgreSQL que serializa la preparación del esquema entre procesos
+LOCK_PREPARACION = 2026_0001
+# Segundos que un worker espera a que otro termine de preparar la base
+ESPERA_PREPARACION = float(os.getenv("DB_PREPARACION_ESPERA", "300"))
+
+# create_all solo crea tablas nuevas: los cambios sobre tablas existentes
+# (índices, columnas) se agregan aquí con un número de versión creciente.
+def _crear_indices(*nombres):
+    """Migración que crea índices declarados en los modelos si aún no existen"""
+    def migrar(conn):
+        for tabla in Base.metadata.sorted_tables:
+            for indice in tabla.indexes:
+                if indice.name in nombres:
+                    indice.create(conn, checkfirst=True)
+    return migrar
+
+def _dia_unico_reto_schedule(conn):
+    """Migración que agrega reto_schedule.activation_day, deja una fila por día y la vuelve única"""
+    columnas = {c["name"] for c in inspect(conn).get_columns("reto_schedule")}
+    if "activation_day" not in columnas:
+        conn.execute(text("ALTER TABLE reto_schedule ADD COLUMN activation_day DATE"))
+
+    tabla = RetoSchedule.__table__
+    filas = conn.execute(
+        select(tabla.c.id, tabla.c.last_activation_date).order_by(tabla.c.last_activation_date, tabla.c.id)
+    ).all()
+    vistos = set()
+    for fila_id, fecha in filas:
+        dia = fecha.date()
+        if dia in vistos:
+            conn.execute(delete(tabla).where(tabla.c.id == fila_id))
+        else:
+            vistos.add(dia)
+            conn.execute(update(tabla).where(tabla.c.id == fila_id).values(activation_day=dia))
+
+    _crear_indices("uq_reto_schedule_activation_day")(conn)
+
+def _triggers_de_version(*tablas):
+    """Migración que crea triggers AFTER INSERT/UPDATE/DELETE que incrementan data_versions.
+
+    Cubren cualquier escritura, también las que no pasan por la app (SQL a mano, scripts de carga).
+    SQLite solo tiene triggers por fila; PostgreSQL usa uno por sentencia.
+    """
+    def migrar(conn):
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("""
+                CREATE OR REPLACE FUNCTION incrementar_data_version() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO data_versions (tabla, version) VALUES (TG_TABLE_NAME, 1)
+                    ON CONFLICT (tabla) DO UPDATE SET version = data_versions.version + 1;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+            """))
+            for tabla in tablas:
+                conn.execute(text(
+                    f"CREATE TRIGGER data_version_{tabla} AFTER INSERT OR UPDATE OR DELETE ON {tabla} "
+                    "FOR EACH STATEMENT EXECUTE FUNCTION incrementar_data_version()"
+                ))
+            return
+        for tabla in tablas:
+            for operacion in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS data_version_{tabla}_{operacion.lower()}
+                    AFTER {operacion} ON {tabla}
+                    BEGIN
+                        INSERT INTO data_versions (tabla, version) VALUES ('{tabla}', 1)
+                        ON CONFLICT (tabla) DO UPDATE SET version = version + 1;
+                    END
+                """))
+    return migrar
+
+def _agregar_columna(tabla: str, columna: str, ddl: str):
+    """Migración que agrega una columna (definida con ddl) si la tabla aún no la tiene"""
+    def migrar(conn):
+        if columna not in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {ddl}"))
+    return migrar
+
+MIGRACIONES = [
+    (1, "Índices para fechas de ahorros, pool de retos y reto_schedule", _crear_indices(
+        "ix_ahorros_date_id",
+        "ix_ahorros_user_id_date_id",
+        "ix_retos_date",
+        "ix_retos_disponibles",
+        "ix_reto_schedule_tipo_fecha",
+    )),
+    (2, "Una activación de reto por día en reto_schedule", _dia_unico_reto_schedule),
+    (3, "Peso de cada penitencia para el sorteo ponderado", _agregar_columna("penitencias", "weight", "FLOAT NOT NULL DEFAULT 1")),
+    (4, "Triggers que incrementan data_versions en cada escritura", _triggers_de_version(*TABLAS_CON_VERSION)),
+]
+
+async def _migrar(conn):
+    """Aplicar en orden las migraciones pendientes, dentro de la transacción de preparar_base_de_datos"""
+    aplicadas = set((await conn.execute(select(SchemaMigration.version))).scalars())
+    for version, descripcion, migrar in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        try:
+            # SAVEPOINT: en PostgreSQL un error aborta la transacción completa
+            async with conn.begin_nested():
+                await conn.run_sync(migrar)
+            print(f"🧱 Migración {version} aplicada: {descripcion}")
+        except (OperationalError, ProgrammingError) as e:
+            # Cambio aplicado antes de existir schema_migrations (o a mano): se registra sin repetirlo
+            if "already exists" not in str(e.orig):
+                raise
+            print(f"🧱 Migración {version} ya estaba aplicada: {descripcion}")
+        await conn.execute(insert(SchemaMigration).values(version=version, description=descripcion))
+
+async def preparar_base_de_datos(engine: AsyncEngine):
+    """Crear tablas, aplicar migraciones y poner al día totales y objetivos (al iniciar el servidor).
+
+    Todo ocurre en una transacción con el candado de escritura tomado (BEGIN IMMEDIATE en SQLite,
+    advisory lock en PostgreSQL): con varios workers arrancando a la vez, uno prepara la base y
+    los demás esperan su turno y la encuentran lista.
+    """
+    limite = time.monotonic() + ESPERA_PREPARACION
+    while True:
+        try:
+            async with engine.connect() as conn:
+                await conn.execution_options(sqlite_begin="IMMEDIATE")
+                async with conn.begin():
+                    if conn.dialect.name == "postgresql":
+                        await conn.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": LOCK_PREPARACION})
+                    await conn.run_sync(Base.metadata.create_all)
+                    await _migrar(conn)
+                    # La sesión se une a la transacción de conn: su commit no la cierra
+                    async with AsyncSession(bind=conn, autoflush=False, expire_on_commit=False) as db:
+                        await db.execute(_upsert(db, DataVersion).values(
+                            tabla=VERSION_EPOCH, version=randrange(1, 2**31)
+                        ).on_conflict_do_nothing(index_elements=[DataVersion.tabla]))
+                        await sincronizar_totales(db)
+                        await sincronizar_objetivos(db)
+                        await db.commit()
+            return
+        except OperationalError as e:
+            # busy_timeout agotado mientras otro worker migra una base grande: volver a esperar
+            if "database is locked" not in str(e.orig) or time.monotonic() > limite:
+                raise
+            print("⏳ Otro proceso está preparando la base de datos, esperando")
+            await asyncio.sleep(0.5)
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -86,7 +455,7 @@ class UserResponse(BaseModel):
     color: str
 
 class MontoCreate(BaseModel):
-    amount: float
+    amount: float = Field(allow_inf_nan=False)
     user_id: int
 
 class MontoResponse(BaseModel):
@@ -98,7 +467,8 @@ class MontoResponse(BaseModel):
 class AhorroCreate(BaseModel):
     user_id: int
     monto_id: int
-    amount: float
+    # json.loads acepta NaN e Infinity; en la base terminan como NULL en los totales
+    amount: float = Field(allow_inf_nan=False)
 
 class AhorroResponse(BaseModel):
     id: int
@@ -107,6 +477,27 @@ class AhorroResponse(BaseModel):
     amount: float
     date: datetime
 
+class AhorroBulkItem(AhorroCreate):
+    date: Optional[datetime] = None  # fecha del movimiento (extractos bancarios); por defecto ahora
+
+class BulkItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    insertados: int
+    rechazados: int
+    resultados: List[BulkItemResult]
+
+class FiltroAhorros(BaseModel):
+    limit: int
+    cursor: Optional[str] = None
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    user_id: Optional[int] = None
+
 class ObjetivoResponse(BaseModel):
     id: int
     amount: float
@@ -122,213 +513,1486 @@ class RetoResponse(BaseModel):
     completed_user2: bool
     penitencia_applied: bool
 
+class EstadisticasUsuario(BaseModel):
+    user_id: int
+    total_mes: float
+    count_mes: int
+    promedio_mes: float
+    total_general: float
+    count_general: int
+    promedio_general: float
+    porcentaje_general: float  # Parte del total de la pareja
+
 class EstadisticasResponse(BaseModel):
     total_mes: float
     faltante_mes: float
     total_general: float
     objetivo_actual: float
     progreso_porcentaje: float
+    por_usuario: List[EstadisticasUsuario] = []
 
-# FastAPI app
-app = FastAPI(title="Ahorro 2026 API")
+class SerieBucket(BaseModel):
+    periodo: date
+    total: float
+    count: int
+    por_usuario: Dict[int, float]
+    acumulado: float
 
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class ProyeccionObjetivo(BaseModel):
+    objetivo_id: int
+    amount: float
+    completed: bool
+    fecha_estimada: Optional[date]
+
+class SerieEstadisticasResponse(BaseModel):
+    granularity: str
+    desde: datetime
+    hasta: datetime
+    user_id: Optional[int]
+    total: float
+    buckets: List[SerieBucket]
+    proyeccion: List[ProyeccionObjetivo]
+
+class ProximoRetoResponse(BaseModel):
+    next_activation_date: datetime
+    activation_type: str
+    retos_disponibles: int
+    automatic_activation: bool = True
+
+class DashboardResponse(BaseModel):
+    """Secciones de /dashboard; solo se incluyen las pedidas en fields"""
+    estadisticas: Optional[EstadisticasResponse] = None
+    objetivos: Optional[List[ObjetivoResponse]] = None
+    retos: Optional[List[RetoResponse]] = None
+    reto_actual: Optional[RetoResponse] = None
+    retos_disponibles: Optional[List[RetoResponse]] = None
+    proximo_reto: Optional[ProximoRetoResponse] = None
+    users: Optional[List[UserResponse]] = None
+    montos: Optional[List[MontoResponse]] = None
+
+# Rutas de la API; create_app las monta en cada instancia
+router = APIRouter()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+def get_estado(request: Request) -> "EstadoApp":
+    """Recursos de la instancia de la app que atiende la petición"""
+    return request.app.state.estado
+
+def _estado_de(db: AsyncSession) -> "EstadoApp":
+    """Instancia dueña de la sesión: su fábrica de sesiones la deja en db.info"""
+    return db.info["estado"]
+
+async def get_db(request: Request):
+    async with get_estado(request).SessionLocal() as db:
         yield db
+
+async def _scalars(db: AsyncSession, stmt) -> list:
+    return (await db.scalars(stmt)).all()
+
+async def _instantanea_de_lectura(db: AsyncSession):
+    """Abrir la transacción de db para que todas sus consultas vean la misma versión de la base.
+
+    pysqlite no envía BEGIN antes de un SELECT, así que cada consulta leería por separado:
+    BEGIN DEFERRED fija la instantánea en la primera lectura. En PostgreSQL, REPEATABLE READ.
+    Debe llamarse antes de la primera consulta de la sesión.
+    """
+    if db.bind.dialect.name == "sqlite":
+        opciones = {"sqlite_begin": "DEFERRED"}
+    else:
+        opciones = {"isolation_level": "REPEATABLE READ"}
+    await db.connection(execution_options=opciones)
+
+# ============================================
+# CACHÉ DE LECTURAS (TTL + LRU, LOCAL O COMPARTIDA)
+# ============================================
+class MemoryCache:
+    """Caché LRU del proceso con TTL por entrada (la misma interfaz async que SharedCache)"""
+
+    def __init__(self, max_entradas: int = 1024):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+
+    async def get(self, clave: str):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[1]
+
+    async def set(self, clave: str, valor, ttl: float):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    async def cerrar(self):
+        pass
+
+class SharedCache:
+    """Caché en un servidor compatible con Redis, compartida entre workers.
+
+    El límite de tamaño lo pone el servidor (maxmemory + allkeys-lru); cada entrada vence con su TTL.
+    El cliente es async (redis.asyncio) para no bloquear el event loop mientras espera al servidor.
+    """
+
+    def __init__(self, cliente, prefijo: str = "ahorro2026:"):
+        self.cliente = cliente
+        self.prefijo = prefijo
+
+    async def get(self, clave: str):
+        valor = await self.cliente.get(f"{self.prefijo}cache:{clave}")
+        return None if valor is None else json.loads(valor)
+
+    async def set(self, clave: str, valor, ttl: float):
+        await self.cliente.set(f"{self.prefijo}cache:{clave}", json.dumps(valor), ex=max(1, int(ttl)))
+
+    async def cerrar(self):
+        await self.cliente.aclose()
+
+class FakeRedis:
+    """Cliente en memoria con el subconjunto de Redis que usa SharedCache (pruebas y desarrollo)"""
+
+    def __init__(self):
+        self._datos = {}  # clave -> (vence o None, valor)
+        self._lock = threading.Lock()
+
+    def _vigente(self, clave: str):
+        entrada = self._datos.get(clave)
+        if entrada and entrada[0] is not None and entrada[0] < time.monotonic():
+            del self._datos[clave]
+            return None
+        return entrada
+
+    async def get(self, clave: str) -> Optional[str]:
+        with self._lock:
+            entrada = self._vigente(clave)
+            return entrada[1] if entrada else None
+
+    async def set(self, clave: str, valor, ex: Optional[int] = None) -> bool:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ex if ex else None, str(valor))
+            return True
+
+    async def aclose(self):
+        pass
+
+def crear_cache(backend: str = CACHE_BACKEND, url: str = CACHE_URL, max_entradas: int = CACHE_MAX_ENTRIES):
+    """Backend de caché según CACHE_BACKEND"""
+    if backend == "redis":
+        import redis.asyncio  # Dependencia opcional: solo se necesita con varios workers
+        return SharedCache(redis.asyncio.Redis.from_url(url, decode_responses=True))
+    if backend == "fake":
+        return SharedCache(FakeRedis())
+    return MemoryCache(max_entradas)
+
+# ============================================
+# MÉTRICAS (FORMATO DE TEXTO DE PROMETHEUS)
+# ============================================
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_JOBS = (0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+class Histograma:
+    """Histograma de buckets fijos; se exporta acumulado como los de Prometheus"""
+
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = buckets
+        self.cuentas = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.suma = 0.0
+
+    def observar(self, valor: float):
+        self.cuentas[bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+
+    def lineas(self, nombre: str, etiquetas: str):
+        acumulado = 0
+        for limite, cuenta in zip(self.buckets + ("+Inf",), self.cuentas):
+            acumulado += cuenta
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f"{nombre}_sum{{{etiquetas}}} {self.suma}"
+        yield f"{nombre}_count{{{etiquetas}}} {acumulado}"
+
+class Metricas:
+    """Contadores e histogramas del proceso.
+
+    Todo se actualiza desde el event loop (los eventos del pool también corren ahí), así que
+    no hace falta lock: registrar una petición son un par de operaciones sobre diccionarios.
+    Con varios workers cada proceso exporta las suyas, distinguidas por la etiqueta pid.
+    """
+
+    def __init__(self):
+        self.peticiones = defaultdict(int)  # (método, ruta, status) -> cantidad
+        self.latencias = defaultdict(Histograma)  # (método, ruta) -> hasta el inicio de la respuesta
+        self.en_curso = 0
+        self.checkout_pool = Histograma()  # tiempo que cada conexión pasa fuera del pool
+        self.jobs = defaultdict(int)  # (job, resultado) -> cantidad
+        self.duracion_jobs = defaultdict(lambda: Histograma(BUCKETS_JOBS))
+
+    def observar_peticion(self, metodo: str, ruta: str, status: int, segundos: float):
+        self.peticiones[(metodo, ruta, status)] += 1
+        self.latencias[(metodo, ruta)].observar(segundos)
+
+    def observar_job(self, job: str, resultado: str, segundos: float):
+        self.jobs[(job, resultado)] += 1
+        self.duracion_jobs[job].observar(segundos)
+
+    def exportar(self, engine: Optional[AsyncEngine]) -> str:
+        pid = f'pid="{os.getpid()}"'
+        lineas = [
+            "# HELP ahorro_http_requests_total Peticiones HTTP atendidas.",
+            "# TYPE ahorro_http_requests_total counter",
+        ]
+        for (metodo, ruta, status), cantidad in sorted(self.peticiones.items()):
+            lineas.append(f'ahorro_http_requests_total{{{pid},method="{metodo}",route="{ruta}",status="{status}"}} {cantidad}')
+        lineas += [
+            "# HELP ahorro_http_request_duration_seconds Tiempo hasta el inicio de la respuesta.",
+            "# TYPE ahorro_http_request_duration_seconds histogram",
+        ]
+        for (metodo, ruta), histograma in sorted(self.latencias.items()):
+            lineas += histograma.lineas("ahorro_http_request_duration_seconds", f'{pid},method="{metodo}",route="{ruta}"')
+        lineas += [
+            "# HELP ahorro_http_requests_in_flight Peticiones en curso (incluye streams abiertos).",
+            "# TYPE ahorro_http_requests_in_flight gauge",
+            f"ahorro_http_requests_in_flight{{{pid}}} {self.en_curso}",
+            "# HELP ahorro_db_pool_checkout_seconds Tiempo que cada conexión pasa fuera del pool.",
+            "# TYPE ahorro_db_pool_checkout_seconds histogram",
+            *self.checkout_pool.lineas("ahorro_db_pool_checkout_seconds", pid),
+        ]
+        pool = engine.pool if engine is not None else None
+        for nombre, metodo, ayuda in (
+            ("ahorro_db_pool_size", "size", "Conexiones fijas del pool."),
+            ("ahorro_db_pool_checked_out", "checkedout", "Conexiones prestadas ahora."),
+            ("ahorro_db_pool_overflow", "overflow", "Conexiones abiertas por encima del tamaño del pool (0 mientras no se llena)."),
+        ):
+            # StaticPool (SQLite en memoria) no lleva estas cuentas
+            if hasattr(pool, metodo):
+                lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge", f"{nombre}{{{pid}}} {max(0, getattr(pool, metodo)())}"]
+        lineas += [
+            "# HELP ahorro_scheduler_job_runs_total Ejecuciones de jobs del scheduler por resultado.",
+            "# TYPE ahorro_scheduler_job_runs_total counter",
+        ]
+        for (job, resultado), cantidad in sorted(self.jobs.items()):
+            lineas.append(f'ahorro_scheduler_job_runs_total{{{pid},job="{job}",result="{resultado}"}} {cantidad}')
+        lineas += [
+            "# HELP ahorro_scheduler_job_duration_seconds Duración de cada ejecución de un job.",
+            "# TYPE ahorro_scheduler_job_duration_seconds histogram",
+        ]
+        for job, histograma in sorted(self.duracion_jobs.items()):
+            lineas += histograma.lineas("ahorro_scheduler_job_duration_seconds", f'{pid},job="{job}"')
+        return "\n".join(lineas) + "\n"
+
+class MetricasMiddleware:
+    """Middleware ASGI: cuenta cada petición por plantilla de ruta y mide hasta el inicio de la respuesta.
+
+    Medir hasta http.response.start evita que los streams (/events, /export/*) inflen la latencia.
+    """
+
+    def __init__(self, app, metricas: Metricas):
+        self.app = app
+        self.metricas = metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metricas = self.metricas
+        inicio = time.perf_counter()
+        respondida = False
+
+        def observar(status: int):
+            # La plantilla (/retos/{reto_id}) y no la URL, para no crear una serie por id
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            metricas.observar_peticion(scope["method"], ruta, status, time.perf_counter() - inicio)
+
+        async def enviar(mensaje):
+            nonlocal respondida
+            if mensaje["type"] == "http.response.start" and not respondida:
+                respondida = True
+                observar(mensaje["status"])
+            await send(mensaje)
+
+        metricas.en_curso += 1
+        try:
+            await self.app(scope, receive, enviar)
+        except Exception:
+            if not respondida:
+                observar(500)
+            raise
+        finally:
+            metricas.en_curso -= 1
+
+# ============================================
+# PERFIL SQL (SERVER-TIMING Y CONSULTAS LENTAS)
+# ============================================
+class PerfilPeticion:
+    """Consultas y tiempo de BD acumulados durante una petición"""
+
+    def __init__(self, etiqueta: str):
+        self.etiqueta = etiqueta
+        self.consultas = 0
+        self.segundos = 0.0
+
+# Perfil de la petición en curso; None fuera de una petición (jobs del scheduler, arranque)
+perfil_actual: contextvars.ContextVar[Optional[PerfilPeticion]] = contextvars.ContextVar("perfil_actual", default=None)
+
+_EXPLICABLES = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+def _explicar(conn, statement: str, parameters, executemany: bool) -> List[str]:
+    """Plan de ejecución de una consulta, con un cursor aparte para no disparar los eventos del engine"""
+    prefijo = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}.get(conn.dialect.name)
+    if prefijo is None or not statement.lstrip().upper().startswith(_EXPLICABLES):
+        return []
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefijo + statement, parameters)
+        return [" | ".join(str(valor) for valor in fila) for fila in cursor.fetchall()]
     finally:
-        db.close()
+        cursor.close()
+
+def activar_perfil_sql(engine: AsyncEngine, umbral_ms: float):
+    """Medir cada consulta del engine; las lentas se imprimen con su EXPLAIN"""
+
+    # El inicio va en el contexto de la ejecución: si la sentencia falla, se descarta con él
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._perfil_inicio = time.perf_counter()
+
+    def despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, "_perfil_inicio", None)
+        if inicio is None:
+            return
+        segundos = time.perf_counter() - inicio
+        perfil = perfil_actual.get()
+        if perfil is not None:
+            perfil.consultas += 1
+            perfil.segundos += segundos
+        if segundos * 1000 < umbral_ms:
+            return
+        origen = perfil.etiqueta if perfil is not None else "fuera de una petición"
+        # Los INSERT masivos traen cientos de VALUES: basta con el comienzo
+        texto = " ".join(statement.split())
+        print(f"🐢 Consulta lenta ({segundos * 1000:.1f} ms) en {origen}: {texto[:500]}{'…' if len(texto) > 500 else ''}")
+        try:
+            for linea in _explicar(conn, statement, parameters, executemany):
+                print(f"   ↳ {linea}")
+        except Exception as e:
+            print(f"   ↳ No se pudo obtener el plan: {e}")
+
+    event.listen(engine.sync_engine, "before_cursor_execute", antes)
+    event.listen(engine.sync_engine, "after_cursor_execute", despues)
+
+class PerfilSQLMiddleware:
+    """Middleware ASGI: abre un PerfilPeticion y lo reporta en Server-Timing al iniciar la respuesta.
+
+    En respuestas en streaming solo cuenta las consultas anteriores al primer byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+        perfil = PerfilPeticion(f"{scope['method']} {scope['path']}")
+        token = perfil_actual.set(perfil)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - inicio) * 1000
+                timing = f'db;dur={perfil.segundos * 1000:.2f};desc="{perfil.consultas} consultas", total;dur={total_ms:.2f}'
+                mensaje.setdefault("headers", []).append((b"server-timing", timing.encode()))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            perfil_actual.reset(token)
+
+# ============================================
+# VERSIONES DE DATOS (ETAG / 304 NOT MODIFIED)
+# ============================================
+# Fila de data_versions con un valor al azar fijado al crear la base: si la base se recrea,
+# los contadores vuelven a empezar pero los ETags viejos dejan de coincidir
+VERSION_EPOCH = "_epoch"
+
+class DataVersions:
+    """Versión de cada tabla según data_versions: la comparten todos los procesos que usan la base"""
+
+    def __init__(self, engine: AsyncEngine):
+        self._engine = engine
+
+    async def leer(self, *tablas: str, db: Optional[AsyncSession] = None) -> Dict[str, int]:
+        """Versión de cada tabla (0 si nunca cambió) y el epoch de la base, en una sola consulta.
+
+        Con db se lee dentro de esa sesión (por ejemplo, en la misma instantánea que los datos).
+        """
+        claves = (VERSION_EPOCH,) + tablas
+        consulta = select(DataVersion.tabla, DataVersion.version).where(DataVersion.tabla.in_(claves))
+        if db is not None:
+            filas = dict((await db.execute(consulta)).all())
+        else:
+            async with self._engine.connect() as conn:
+                filas = dict((await conn.execute(consulta)).all())
+        return {clave: filas.get(clave, 0) for clave in claves}
+
+async def _versiones_de(request: Request, tablas: tuple) -> Dict[str, int]:
+    """Versiones de las tablas de una petición: el ETag y la caché de lecturas usan la misma lectura"""
+    leidas = getattr(request.state, "versiones", {})
+    if not set(tablas) <= leidas.keys():
+        leidas = {**leidas, **await get_estado(request).versiones.leer(*tablas)}
+        request.state.versiones = leidas
+    return leidas
+
+async def _validar_etag(request: Request, response: Response, *tablas: str, variante: str = "") -> Optional[Response]:
+    """Calcular el ETag de un GET a partir de las versiones de sus tablas.
+
+    Devuelve una respuesta 304 si el cliente ya tiene esa versión (con una sola consulta a
+    data_versions); si no, agrega ETag y Cache-Control a la respuesta y devuelve None.
+    """
+    versiones = await _versiones_de(request, tablas)
+    partes = [format(versiones[VERSION_EPOCH], "x")] + [f"{tabla}.{versiones[tabla]}" for tabla in tablas]
+    if variante:
+        partes.append(variante)
+    if request.url.query:
+        partes.append(hashlib.md5(request.url.query.encode()).hexdigest()[:8])
+    etag = f'W/"{"-".join(partes)}"'
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [valor.strip() for valor in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+async def _leer_cacheado(request: Request, nombre: str, tablas: tuple, calcular, variante: str = "", ttl: Optional[float] = None):
+    """Resultado (ya serializable a JSON) de una lectura, reutilizado mientras no cambien sus tablas.
+
+    La clave incluye la versión de cada tabla: cada commit que las modifica deja las entradas
+    viejas inalcanzables, y el TTL y el LRU terminan de sacarlas.
+    """
+    estado = get_estado(request)
+    # Las versiones se leen antes de calcular: si una escritura llega en medio, la entrada queda vieja y no se vuelve a usar
+    versiones = await _versiones_de(request, tablas)
+    clave = ":".join(
+        [nombre, variante, str(versiones[VERSION_EPOCH])] + [f"{tabla}.{versiones[tabla]}" for tabla in tablas]
+    )
+    # Envuelto en una lista para distinguir un resultado None de una entrada ausente
+    entrada = await estado.cache.get(clave)
+    if entrada is None:
+        entrada = [jsonable_encoder(await calcular())]
+        await estado.cache.set(clave, entrada, ttl or CACHE_TTL)
+    return entrada[0]
+
+def _minuto_actual() -> str:
+    """Variante de ETag para respuestas que cambian con el tiempo (vencimiento de retos de 24h)"""
+    return str(int(time.time() // 60))
+
+# ============================================
+# TOTALES DE AHORRO (AGREGADOS INCREMENTALES)
+# ============================================
+def _upsert(db: AsyncSession, model):
+    """INSERT ... ON CONFLICT del dialecto activo (SQLite o PostgreSQL)"""
+    # Import diferido: solo se carga el dialecto que se usa
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(model)
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert(model)
+
+async def _acumular_totales(db: AsyncSession, movimientos):
+    """Sumar ahorros (user_id, fecha, amount) a ahorro_totales dentro de la transacción actual"""
+    acumulado = {}
+    for user_id, fecha, amount in movimientos:
+        for year, month in ((fecha.year, fecha.month), PERIODO_HISTORICO):
+            for uid in (user_id, TOTAL_PAREJA):
+                total, count = acumulado.get((year, month, uid), (0.0, 0))
+                acumulado[(year, month, uid)] = (total + amount, count + 1)
+
+    if not acumulado:
+        return
+
+    stmt = _upsert(db, AhorroTotal).values([
+        {"year": year, "month": month, "user_id": uid, "total": total, "count": count}
+        for (year, month, uid), (total, count) in acumulado.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["year", "month", "user_id"],
+        set_={
+            "total": AhorroTotal.total + stmt.excluded.total,
+            "count": AhorroTotal.count + stmt.excluded.count,
+        },
+    )
+    await db.execute(stmt)
+
+async def _total_periodo(db: AsyncSession, year: int, month: int, user_id: int = TOTAL_PAREJA) -> float:
+    """Leer un total acumulado (búsqueda por clave única, sin recorrer ahorros)"""
+    total = await db.scalar(select(AhorroTotal.total).where(
+        AhorroTotal.year == year,
+        AhorroTotal.month == month,
+        AhorroTotal.user_id == user_id
+    ))
+    return float(total) if total is not None else 0.0
+
+async def _reconstruir_totales(db: AsyncSession):
+    """Recalcular ahorro_totales desde cero a partir de la tabla ahorros"""
+    await db.execute(delete(AhorroTotal))
+
+    year = extract("year", Ahorro.date)
+    month = extract("month", Ahorro.date)
+    filas = []
+    for y, m, uid, total, count in await db.execute(
+        select(year, month, Ahorro.user_id, func.sum(Ahorro.amount), func.count(Ahorro.id))
+        .group_by(year, month, Ahorro.user_id)
+    ):
+        filas.append((int(y), int(m), uid, total, count))
+
+    acumulado = {}
+    for y, m, uid, total, count in filas:
+        for clave in ((y, m, uid), (y, m, TOTAL_PAREJA), (*PERIODO_HISTORICO, uid), (*PERIODO_HISTORICO, TOTAL_PAREJA)):
+            t, c = acumulado.get(clave, (0.0, 0))
+            acumulado[clave] = (t + total, c + count)
+
+    if acumulado:
+        await db.execute(insert(AhorroTotal), [
+            {"year": y, "month": m, "user_id": uid, "total": total, "count": count}
+            for (y, m, uid), (total, count) in acumulado.items()
+        ])
+
+async def sincronizar_totales(db: AsyncSession):
+    """Reconstruir ahorro_totales si no coincide con la tabla ahorros (p. ej. bases de datos previas)"""
+    registrados = await db.scalar(select(AhorroTotal.count).where(
+        AhorroTotal.year == PERIODO_HISTORICO[0],
+        AhorroTotal.month == PERIODO_HISTORICO[1],
+        AhorroTotal.user_id == TOTAL_PAREJA
+    )) or 0
+    existentes = await db.scalar(select(func.count(Ahorro.id))) or 0
+
+    if registrados != existentes:
+        await _reconstruir_totales(db)
+        print(f"📊 Totales de ahorro reconstruidos ({existentes} ahorros)")
+
+# ============================================
+# EVENTOS EN TIEMPO REAL (SERVER-SENT EVENTS)
+# ============================================
+class EventBroker:
+    """Reparte los cambios de datos a los dashboards conectados a /events"""
+
+    def __init__(self, max_pendientes: int = 100):
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+        self._secuencia = itertools.count(1)
+        self._max_pendientes = max_pendientes
+
+    def suscribir(self) -> asyncio.Queue:
+        cola = asyncio.Queue(maxsize=self._max_pendientes)
+        with self._lock:
+            self._suscriptores.add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def cancelar(self, cola: asyncio.Queue):
+        with self._lock:
+            self._suscriptores = {(loop, c) for loop, c in self._suscriptores if c is not cola}
+
+    def hay_suscriptores(self) -> bool:
+        """Para no calcular el contenido de un evento que nadie va a recibir"""
+        return bool(self._suscriptores)
+
+    def publicar(self, tipo: str, data):
+        """Serializar el evento una sola vez y encolarlo para cada suscriptor (seguro desde cualquier hilo)"""
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        if not suscriptores:
+            return
+
+        mensaje = f"id: {next(self._secuencia)}\nevent: {tipo}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(self._encolar, cola, mensaje)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.cancelar(cola)
+
+    @staticmethod
+    def _encolar(cola: asyncio.Queue, mensaje: str):
+        if cola.full():
+            # Cliente lento: descartar el evento más viejo en lugar de bloquear al publicador
+            cola.get_nowait()
+        cola.put_nowait(mensaje)
+
+def _reto_a_dict(reto: Reto) -> dict:
+    return RetoResponse.model_validate(reto, from_attributes=True).model_dump()
+
+async def _contar_retos_disponibles(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count(Reto.id)).where(Reto.date.is_(None)))
+
+async def _publicar_reto(db: AsyncSession, accion: str, reto: Reto):
+    """Notificar un cambio de reto junto con el nuevo tamaño del pool"""
+    broker = _estado_de(db).broker
+    broker.publicar("reto", {"accion": accion, "reto": _reto_a_dict(reto)})
+    if accion == "activado" and broker.hay_suscriptores():
+        broker.publicar("retos_disponibles", {"total": await _contar_retos_disponibles(db)})
+
+# ============================================
+# OBJETIVOS (EVALUADOS AL ESCRIBIR AHORROS)
+# ============================================
+async def _sembrar_objetivos(db: AsyncSession):
+    """Crear los objetivos por defecto si la tabla está vacía"""
+    if await db.scalar(select(Objetivo.id).limit(1)) is None:
+        db.add_all([Objetivo(amount=amount) for amount in OBJETIVOS_AMOUNTS])
+        await db.flush()
+
+async def _evaluar_objetivos(db: AsyncSession, total_general: float) -> List[Objetivo]:
+    """Marcar los objetivos alcanzados por el total; devuelve los recién completados"""
+    alcanzados = (await db.scalars(select(Objetivo).where(
+        Objetivo.completed == False,
+        Objetivo.amount <= total_general
+    ))).all()
+
+    for objetivo in alcanzados:
+        objetivo.completed = True
+        objetivo.completed_at = datetime.utcnow()
+
+    return alcanzados
+
+async def _publicar_objetivos(db: AsyncSession):
+    broker = _estado_de(db).broker
+    if not broker.hay_suscriptores():
+        return
+    objetivos = (await db.scalars(select(Objetivo).order_by(Objetivo.amount))).all()
+    broker.publicar("objetivos", [ObjetivoResponse.model_validate(o, from_attributes=True) for o in objetivos])
+
+async def sincronizar_objetivos(db: AsyncSession):
+    """Sembrar objetivos y ponerlos al día con el total actual (al iniciar el servidor)"""
+    await _sembrar_objetivos(db)
+    await _evaluar_objetivos(db, await _total_periodo(db, *PERIODO_HISTORICO))
+    await db.flush()
+
+# ============================================
+# POOL DE RETOS (SELECCIÓN ALEATORIA EN LA BASE DE DATOS)
+# ============================================
+RECLAMO_REINTENTOS = 5
+DURACION_RETO = timedelta(hours=24)
+
+async def _reto_activo_reciente(db: AsyncSession, now: datetime) -> Optional[Reto]:
+    """Reto activado en las últimas 24 horas, completado o no"""
+    return await db.scalar(select(Reto).where(
+        and_(
+            Reto.date.isnot(None),
+            Reto.date >= now - DURACION_RETO
+        )
+    ).limit(1))
+
+async def _reclamar_reto_aleatorio(db: AsyncSession, now: datetime) -> Optional[Reto]:
+    """Elegir un reto disponible con probabilidad uniforme y reclamarlo de forma atómica.
+
+    Cuenta el pool y salta a una posición aleatoria sobre el índice parcial de disponibles,
+    sin cargar el pool en memoria. El UPDATE solo tiene efecto si el reto sigue libre y no
+    hay otro reto activo en las últimas 24 horas, así que dos activaciones concurrentes
+    nunca dejan dos retos activos ni se quedan con el mismo reto.
+    """
+    otro = aliased(Reto)
+    hay_reto_activo = exists().where(otro.date.isnot(None), otro.date >= now - DURACION_RETO)
+
+    for _ in range(RECLAMO_REINTENTOS):
+        disponibles = await _contar_retos_disponibles(db)
+        if not disponibles:
+            return None
+
+        candidato = await db.scalar(
+            select(Reto.id).where(Reto.date.is_(None)).order_by(Reto.id).offset(randrange(disponibles)).limit(1)
+        )
+        if candidato is None:
+            continue
+
+        reclamo = await db.execute(
+            update(Reto)
+            .where(Reto.id == candidato, Reto.date.is_(None), ~hay_reto_activo)
+            .values(date=now, completed_user1=False, completed_user2=False, penitencia_applied=False)
+            .execution_options(synchronize_session=False)
+        )
+        if reclamo.rowcount == 1:
+            return await db.get(Reto, candidato, populate_existing=True)
+        if await _reto_activo_reciente(db, now):
+            return None
+        # Otro proceso reclamó ese reto primero: volver a sortear
+
+    return None
+
+async def _activar_reto(db: AsyncSession, now: datetime, activation_type: str):
+    """Registrar la activación del día y reclamar un reto, sin hacer commit.
+
+    Devuelve (estado, reto) con estado "activado", "ya_activado", "activo" o "sin_retos".
+    La fila de reto_schedule es única por día: si otro worker ya activó hoy la inserción
+    falla (o espera a que el otro termine) y no se reclama ningún reto.
+    """
+    db.add(RetoSchedule(last_activation_date=now, activation_type=activation_type, activation_day=now.date()))
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        return "ya_activado", None
+
+    reto = await _reclamar_reto_aleatorio(db, now)
+    if reto:
+        return "activado", reto
+
+    await db.rollback()
+    reto_activo = await _reto_activo_reciente(db, now)
+    if reto_activo:
+        return "activo", reto_activo
+    return "sin_retos", None
 
 # ============================================
 # FUNCIÓN PARA ACTIVAR RETOS AUTOMÁTICAMENTE
 # ============================================
-def activar_reto_automatico():
+async def activar_reto_automatico(activation_type: Optional[str] = None, estado: Optional["EstadoApp"] = None):
     """Función que se ejecuta automáticamente el día 1 y 15"""
-    db = SessionLocal()
-    try:
-        now = datetime.now()
-        activation_type = "day_1" if now.day == 1 else "day_15"
-        
-        # Verificar si ya se activó un reto hoy
-        ultima_activacion = db.query(RetoSchedule).filter(
-            RetoSchedule.activation_type == activation_type
-        ).order_by(RetoSchedule.last_activation_date.desc()).first()
-        
-        # Si ya se activó hoy, no hacer nada
-        if ultima_activacion:
-            if ultima_activacion.last_activation_date.date() == now.date():
+    # Los jobs guardados en la BD (modo leader) no llevan la instancia: es la líder de este proceso
+    estado = estado or _estado_lider
+    if estado is None:
+        print("⚠️ Activación automática sin instancia de la app en este proceso")
+        return
+    inicio = time.perf_counter()
+    resultado = "error"
+    async with estado.SessionLocal() as db:
+        try:
+            now = datetime.now()
+            # Una ejecución tardía (recuperada) sigue contando para su quincena
+            activation_type = activation_type or ("day_1" if now.day < 15 else "day_15")
+            
+            # Registrar la activación del día y reclamar un reto del pool en la misma transacción
+            resultado, reto_seleccionado = await _activar_reto(db, now, activation_type)
+            
+            if resultado == "ya_activado":
                 print(f"✅ Reto ya fue activado hoy ({activation_type})")
                 return
-        
-        # Verificar si ya existe un reto activo
-        reto_activo = db.query(Reto).filter(
-            and_(
-                Reto.date.isnot(None),
-                Reto.date >= now - timedelta(hours=24)
-            )
-        ).first()
-        
-        if reto_activo:
-            print(f"⚠️ Ya existe un reto activo, no se activará otro")
-            return
-        
-        # Obtener retos disponibles (sin fecha asignada)
-        retos_disponibles = db.query(Reto).filter(Reto.date.is_(None)).all()
-        
-        if not retos_disponibles:
-            print(f"❌ No hay retos disponibles en el pool")
-            return
-        
-        # Seleccionar uno aleatorio
-        reto_seleccionado = choice(retos_disponibles)
-        
-        # Activarlo
-        reto_seleccionado.date = now
-        reto_seleccionado.completed_user1 = False
-        reto_seleccionado.completed_user2 = False
-        reto_seleccionado.penitencia_applied = False
-        
-        # Registrar la activación
-        nueva_activacion = RetoSchedule(
-            last_activation_date=now,
-            activation_type=activation_type
-        )
-        db.add(nueva_activacion)
-        
-        db.commit()
-        print(f"🎯 Reto activado automáticamente: {reto_seleccionado.description}")
-        
-    except Exception as e:
-        print(f"❌ Error al activar reto automático: {e}")
-        db.rollback()
-    finally:
-        db.close()
+            if resultado == "activo":
+                print(f"⚠️ Ya existe un reto activo, no se activará otro")
+                return
+            if resultado == "sin_retos":
+                print(f"❌ No hay retos disponibles en el pool")
+                return
+            
+            await db.commit()
+            print(f"🎯 Reto activado automáticamente: {reto_seleccionado.description}")
+            await _publicar_reto(db, "activado", reto_seleccionado)
+            
+        except Exception as e:
+            resultado = "error"
+            print(f"❌ Error al activar reto automático: {e}")
+            await db.rollback()
+        finally:
+            estado.metricas.observar_job("activar_reto_automatico", resultado, time.perf_counter() - inicio)
 
 # ============================================
 # CONFIGURAR SCHEDULER
 # ============================================
-scheduler = BackgroundScheduler()
+JOB_DEFAULTS = {
+    "misfire_grace_time": int(SCHEDULER_MISFIRE_GRACE_HORAS * 3600),
+    "coalesce": SCHEDULER_COALESCE,
+}
+
+# APScheduler se importa al arrancar la app, no al importar el módulo
+def _crear_scheduler(modo: str, database_url: str):
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    if modo == "leader":
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        # Los jobs se guardan en la BD: el líder que tome el lease retoma sus próximas ejecuciones
+        return AsyncIOScheduler(job_defaults=JOB_DEFAULTS, jobstores={
+            "default": SQLAlchemyJobStore(url=_url_sync(database_url), tablename="apscheduler_jobs")
+        })
+    return AsyncIOScheduler(job_defaults=JOB_DEFAULTS)
 
 # Zona horaria de Colombia
 colombia_tz = pytz.timezone('America/Bogota')
 
-# Programar para el día 1 de cada mes a las 00:01
-scheduler.add_job(
-    activar_reto_automatico,
-    CronTrigger(day=1, hour=0, minute=1, timezone=colombia_tz),
-    id='activar_reto_dia_1',
-    name='Activar reto automático día 1'
-)
-
-# Programar para el día 15 de cada mes a las 00:01
-scheduler.add_job(
-    activar_reto_automatico,
-    CronTrigger(day=15, hour=0, minute=1, timezone=colombia_tz),
-    id='activar_reto_dia_15',
-    name='Activar reto automático día 15'
-)
-
-# Iniciar el scheduler
-scheduler.start()
-
-# Eventos de inicio y cierre
-@app.on_event("startup")
-async def startup_event():
+# Activaciones automáticas: día 1 y 15 de cada mes a las 00:01
+JOBS_RETOS = [
+    ("activar_reto_dia_1", "Activar reto automático día 1", 1),
+    ("activar_reto_dia_15", "Activar reto automático día 15", 15),
+]
+
+def _trigger_reto(dia: int):
+    from apscheduler.triggers.cron import CronTrigger
+    return CronTrigger(day=dia, hour=0, minute=1, timezone=colombia_tz)
+
+def programar_jobs(estado: "EstadoApp"):
+    """Registrar los jobs de activación que aún no existan (el job store puede conservarlos)"""
+    scheduler = estado.scheduler
+    # El job store en memoria (modo local) guarda la instancia con el job; el de la BD solo
+    # guarda la referencia a la función, que encuentra la instancia en _estado_lider
+    kwargs = {} if estado.settings.scheduler_mode == "leader" else {"estado": estado}
+    for job_id, nombre, dia in JOBS_RETOS:
+        if scheduler.get_job(job_id):
+            # Job guardado por un despliegue anterior: aplicar la configuración actual
+            scheduler.modify_job(job_id, **JOB_DEFAULTS)
+            continue
+        scheduler.add_job(
+            activar_reto_automatico,
+            _trigger_reto(dia),
+            id=job_id,
+            name=nombre,
+            kwargs=kwargs
+        )
+
+# ============================================
+# CALENDARIO DE ACTIVACIONES (/retos/proximo)
+# ============================================
+class CalendarioRetos:
+    """Próxima activación y tamaño del pool, recalculados solo cuando dejan de ser válidos"""
+
+    def __init__(self, estado: "EstadoApp"):
+        self._estado = estado
+        self._triggers = [(_trigger_reto(dia), "day_1" if dia == 1 else "day_15") for _, _, dia in JOBS_RETOS]
+        self._proxima = None
+        self._disponibles = None  # (versión de retos, total)
+
+    def proxima(self, ahora: datetime):
+        """(fecha, activation_type) de la siguiente activación según los CronTrigger del scheduler"""
+        if self._proxima is None or self._proxima[0] <= ahora:
+            self._proxima = min(
+                ((trigger.get_next_fire_time(None, ahora), tipo) for trigger, tipo in self._triggers),
+                key=lambda activacion: activacion[0]
+            )
+        return self._proxima
+
+    async def disponibles(self, version: int, db: Optional[AsyncSession] = None) -> int:
+        """Retos sin activar; solo se vuelven a contar cuando cambia la versión de la tabla retos.
+
+        La versión la lee quien llama antes de contar (la misma del ETag de la petición):
+        un cambio concurrente invalida el conteo en la siguiente llamada.
+        """
+        if self._disponibles is None or self._disponibles[0] != version:
+            if db is None:
+                async with self._estado.SessionLocal() as db:
+                    self._disponibles = (version, await _contar_retos_disponibles(db))
+            else:
+                self._disponibles = (version, await _contar_retos_disponibles(db))
+        return self._disponibles[1]
+
+# ============================================
+# POOL DE PENITENCIAS (SORTEO EN MEMORIA)
+# ============================================
+MODOS_PENITENCIA = ("uniforme", "ponderado", "sin_repetir")
+
+class PoolPenitencias:
+    """Descripciones de penitencias en memoria, recargadas solo cuando cambia la tabla penitencias.
+
+    La versión de la tabla la pasa quien llama, leída una sola vez por petición con _versiones_de.
+    """
+
+    def __init__(self, estado: "EstadoApp"):
+        self._estado = estado
+        self._version = None
+        self._descripciones: List[str] = []
+        self._pesos_acumulados: List[float] = []
+        self._bolsa: List[int] = []  # Índices pendientes del modo sin_repetir, ya barajados
+        self._lock = asyncio.Lock()
+
+    async def _actualizar(self, version: int):
+        if version == self._version:
+            return
+        async with self._lock:
+            if version == self._version:
+                return
+            async with self._estado.SessionLocal() as db:
+                filas = (await db.execute(
+                    select(Penitencia.description, Penitencia.weight).order_by(Penitencia.id)
+                )).all()
+            self._descripciones = [descripcion for descripcion, _ in filas]
+            self._pesos_acumulados = list(itertools.accumulate(max(peso or 0.0, 0.0) for _, peso in filas))
+            self._bolsa = []
+            self._version = version
+
+    async def descripciones(self, version: int) -> List[str]:
+        await self._actualizar(version)
+        return self._descripciones
+
+    async def sortear(self, version: int, modo: str = "uniforme") -> Optional[str]:
+        """Una descripción al azar; None si no hay penitencias"""
+        await self._actualizar(version)
+        descripciones = self._descripciones
+        if not descripciones:
+            return None
+        if modo == "ponderado" and self._pesos_acumulados[-1] > 0:
+            return choices(descripciones, cum_weights=self._pesos_acumulados)[0]
+        if modo == "sin_repetir":
+            # Cada penitencia sale una vez antes de repetir (por proceso)
+            if not self._bolsa:
+                self._bolsa = list(range(len(descripciones)))
+                shuffle(self._bolsa)
+            return descripciones[self._bolsa.pop()]
+        return choice(descripciones)
+
+# ============================================
+# RECUPERAR ACTIVACIONES PERDIDAS
+# ============================================
+def _activacion_esperada_anterior(ahora: datetime):
+    """Última fecha del calendario (día 1 o 15 a las 00:01 en Bogotá) no posterior a ahora"""
+    ahora = ahora.astimezone(colombia_tz)
+    anio_anterior, mes_anterior = (ahora.year - 1, 12) if ahora.month == 1 else (ahora.year, ahora.month - 1)
+    for anio, mes, dia in ((ahora.year, ahora.month, 15), (ahora.year, ahora.month, 1), (anio_anterior, mes_anterior, 15)):
+        fecha = colombia_tz.localize(datetime(anio, mes, dia, 0, 1))
+        if fecha <= ahora:
+            return fecha, "day_1" if dia == 1 else "day_15"
+
+async def recuperar_activaciones(estado: "EstadoApp"):
+    """Ejecutar la última activación del calendario si no quedó registrada en reto_schedule.
+
+    Se llama al arrancar el scheduler. Solo mira la última fecha esperada: las anteriores
+    ya no importan porque solo puede haber un reto activo. Si el job de APScheduler también
+    la recupera, la clave única por día de reto_schedule deja pasar solo una.
+    """
+    ahora = datetime.now(colombia_tz)
+    esperada, activation_type = _activacion_esperada_anterior(ahora)
+    if ahora - esperada > timedelta(hours=SCHEDULER_MISFIRE_GRACE_HORAS):
+        return
+
+    # last_activation_date se guarda en la hora local del servidor, sin zona horaria
+    esperada_local = esperada.astimezone().replace(tzinfo=None)
+    async with estado.SessionLocal() as db:
+        # Cualquier activación desde la fecha esperada cubre la quincena, también una manual
+        registrada = await db.scalar(select(RetoSchedule.id).where(
+            RetoSchedule.last_activation_date >= esperada_local
+        ).limit(1))
+    if registrada:
+        return
+
+    print(f"🔁 Activación perdida del {esperada:%Y-%m-%d %H:%M} ({activation_type}), ejecutándola ahora")
+    await activar_reto_automatico(activation_type, estado)
+
+# ============================================
+# LÍDER DEL SCHEDULER (VARIOS WORKERS)
+# ============================================
+LEASE_SCHEDULER = "scheduler_retos"
+
+# Instancia en modo leader de este proceso: los jobs guardados en la BD la usan al ejecutarse
+_estado_lider: Optional["EstadoApp"] = None
+
+async def _tomar_lease(estado: "EstadoApp") -> bool:
+    """Tomar o renovar el lease del scheduler; falla si otro proceso lo tiene vigente"""
+    now = datetime.utcnow()
+    vence = now + timedelta(seconds=SCHEDULER_LEASE_TTL)
+    owner = estado.owner
+    async with estado.SessionLocal() as db:
+        renovado = await db.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == LEASE_SCHEDULER,
+                or_(SchedulerLease.owner == owner, SchedulerLease.expires_at < now)
+            )
+            .values(owner=owner, expires_at=vence)
+        )
+        if renovado.rowcount == 0:
+            try:
+                await db.execute(insert(SchedulerLease).values(name=LEASE_SCHEDULER, owner=owner, expires_at=vence))
+            except IntegrityError:
+                # Ya existe y es de otro proceso
+                return False
+        await db.commit()
+    return True
+
+async def _liberar_lease(estado: "EstadoApp"):
+    """Soltar el lease al cerrar para que otro worker lo tome sin esperar a que venza"""
+    async with estado.SessionLocal() as db:
+        await db.execute(delete(SchedulerLease).where(
+            SchedulerLease.name == LEASE_SCHEDULER,
+            SchedulerLease.owner == estado.owner
+        ))
+        await db.commit()
+
+def _aplicar_liderazgo(estado: "EstadoApp", es_lider: bool) -> bool:
+    """Arrancar, reanudar o pausar el scheduler según se tenga el lease; True si se acaba de tomar"""
+    from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+    scheduler = estado.scheduler
+    if es_lider and not scheduler.running:
+        scheduler.start()
+        programar_jobs(estado)
+        print(f"👑 Este proceso ejecuta el scheduler de retos ({estado.owner})")
+        return True
+    if es_lider and scheduler.state == STATE_PAUSED:
+        scheduler.resume()
+        print(f"👑 Scheduler de retos reanudado ({estado.owner})")
+        return True
+    if not es_lider and scheduler.state == STATE_RUNNING:
+        scheduler.pause()
+        print(f"⏸️ Lease del scheduler perdido, jobs en pausa ({estado.owner})")
+    return False
+
+async def _ciclo_lider(estado: "EstadoApp"):
+    """Renovar el lease cada tercio de su duración mientras viva el proceso"""
+    while True:
+        try:
+            es_lider = await _tomar_lease(estado)
+        except Exception as e:
+            print(f"⚠️ No se pudo renovar el lease del scheduler: {e}")
+            es_lider = False
+        if _aplicar_liderazgo(estado, es_lider):
+            await recuperar_activaciones(estado)
+        await asyncio.sleep(SCHEDULER_LEASE_TTL / 3)
+
+# ============================================
+# ESTADO POR INSTANCIA, INICIO Y CIERRE
+# ============================================
+class EstadoApp:
+    """Recursos de una instancia de la app: engine, sesiones, caché, métricas, eventos y scheduler.
+
+    create_app lo guarda en app.state.estado; los endpoints lo toman de request.app y las
+    sesiones de db.info, así que dos apps en el mismo proceso no comparten datos ni conexiones.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.metricas = Metricas()
+        self.broker = EventBroker()
+        # Identifica a esta instancia en el lease del scheduler
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # Lo que abre conexiones o importa APScheduler se crea en iniciar_servidor
+        self.engine: Optional[AsyncEngine] = None
+        self.SessionLocal: Optional[async_sessionmaker] = None
+        self.cache = None
+        self.versiones: Optional[DataVersions] = None
+        self.calendario_retos: Optional[CalendarioRetos] = None
+        self.pool_penitencias: Optional[PoolPenitencias] = None
+        self.scheduler = None
+        self.ciclo_lider: Optional[asyncio.Task] = None
+
+async def iniciar_servidor(estado: EstadoApp):
+    """Conectar la base de datos, preparar el esquema y el estado en memoria, y arrancar el scheduler"""
+    global _estado_lider
+    settings = estado.settings
+    configurar_base_de_datos(estado)
+    if settings.sql_profile:
+        activar_perfil_sql(estado.engine, settings.sql_slow_ms)
+    estado.cache = crear_cache(settings.cache_backend, settings.cache_url, settings.cache_max_entries)
+    estado.versiones = DataVersions(estado.engine)
+    estado.calendario_retos = CalendarioRetos(estado)
+    estado.pool_penitencias = PoolPenitencias(estado)
+
+    await preparar_base_de_datos(estado.engine)
     print("🚀 Servidor iniciado")
-    print("⏰ Scheduler de retos activado")
+    # AsyncIOScheduler necesita el event loop del servidor, que solo existe desde aquí
+    estado.scheduler = _crear_scheduler(settings.scheduler_mode, settings.database_url)
+    if settings.scheduler_mode == "leader":
+        if _estado_lider is not None:
+            raise RuntimeError("Ya hay una instancia en modo leader en este proceso; usa scheduler_mode='off' en las demás")
+        _estado_lider = estado
+        estado.ciclo_lider = asyncio.create_task(_ciclo_lider(estado))
+        print("⏰ Scheduler de retos en modo líder: lo ejecuta un solo proceso")
+    elif settings.scheduler_mode == "off":
+        print("⏰ Scheduler de retos desactivado en este proceso")
+        return
+    else:
+        programar_jobs(estado)
+        estado.scheduler.start()
+        print("⏰ Scheduler de retos activado")
+        await recuperar_activaciones(estado)
     print("📅 Próximas activaciones automáticas: día 1 y 15 de cada mes")
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    scheduler.shutdown()
+async def detener_servidor(estado: EstadoApp):
+    global _estado_lider
+    if estado.ciclo_lider:
+        estado.ciclo_lider.cancel()
+        estado.ciclo_lider = None
+    if estado.scheduler and estado.scheduler.running:
+        estado.scheduler.shutdown()
+    if estado.settings.scheduler_mode == "leader":
+        await _liberar_lease(estado)
+        if _estado_lider is estado:
+            _estado_lider = None
+    await estado.cache.cerrar()
+    await estado.engine.dispose()
     print("🛑 Scheduler detenido")
 
 # ============================================
 # ENDPOINTS
 # ============================================
 
-@app.get("/")
-def read_root():
+@router.get("/")
+async def read_root():
     return {"message": "Ahorro 2026 API"}
 
-@app.post("/users", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+@router.post("/users", response_model=UserResponse)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = User(name=user.name, color=user.color)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-@app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+@router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(user_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if no_modificado := await _validar_etag(request, response, "users"):
+        return no_modificado
+
+    async def leer_usuario():
+        user = await db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    return await _leer_cacheado(request, "user", ("users",), leer_usuario, variante=str(user_id))
 
-@app.get("/users", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+@router.get("/users", response_model=List[UserResponse])
+async def get_users(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if no_modificado := await _validar_etag(request, response, "users"):
+        return no_modificado
+    return await _leer_cacheado(request, "users", ("users",), lambda: _scalars(db, select(User)))
 
-@app.post("/montos", response_model=MontoResponse)
-def create_monto(monto: MontoCreate, db: Session = Depends(get_db)):
+@router.post("/montos", response_model=MontoResponse)
+async def create_monto(monto: MontoCreate, db: AsyncSession = Depends(get_db)):
     db_monto = Monto(amount=monto.amount, user_id=monto.user_id)
     db.add(db_monto)
-    db.commit()
-    db.refresh(db_monto)
+    await db.commit()
+    await db.refresh(db_monto)
     return db_monto
 
-@app.get("/montos", response_model=List[MontoResponse])
-def get_montos(db: Session = Depends(get_db)):
-    return db.query(Monto).all()
+@router.get("/montos", response_model=List[MontoResponse])
+async def get_montos(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if no_modificado := await _validar_etag(request, response, "montos"):
+        return no_modificado
+    return (await db.scalars(select(Monto))).all()
 
-@app.put("/montos/{monto_id}/select")
-def select_monto(monto_id: int, user_id: int = Query(...), db: Session = Depends(get_db)):
-    monto = db.query(Monto).filter(Monto.id == monto_id).first()
+@router.put("/montos/{monto_id}/select")
+async def select_monto(monto_id: int, user_id: int = Query(...), db: AsyncSession = Depends(get_db)):
+    monto = await db.get(Monto, monto_id)
     if not monto:
         raise HTTPException(status_code=404, detail="Monto not found")
     
     monto.selected = True
-    db.commit()
+    await db.commit()
     
     return {"message": "Monto selected"}
 
-@app.post("/ahorros", response_model=AhorroResponse)
-def create_ahorro(ahorro: AhorroCreate, db: Session = Depends(get_db)):
+@router.post("/ahorros", response_model=AhorroResponse)
+async def create_ahorro(ahorro: AhorroCreate, db: AsyncSession = Depends(get_db)):
     db_ahorro = Ahorro(
         user_id=ahorro.user_id,
         monto_id=ahorro.monto_id,
-        amount=ahorro.amount
+        amount=ahorro.amount,
+        date=datetime.utcnow()
     )
     db.add(db_ahorro)
-    db.commit()
-    db.refresh(db_ahorro)
+    await _acumular_totales(db, [(db_ahorro.user_id, db_ahorro.date, db_ahorro.amount)])
+    completados = await _evaluar_objetivos(db, await _total_periodo(db, *PERIODO_HISTORICO))
+    await db.commit()
+    await db.refresh(db_ahorro)
+
+    broker = _estado_de(db).broker
+    # Sin dashboards conectados a este proceso no se recalculan las estadísticas
+    if broker.hay_suscriptores():
+        broker.publicar("ahorro", AhorroResponse.model_validate(db_ahorro, from_attributes=True))
+        broker.publicar("estadisticas", await _calcular_estadisticas(db))
+        if completados:
+            await _publicar_objetivos(db)
     return db_ahorro
 
-@app.get("/ahorros", response_model=List[AhorroResponse])
-def get_ahorros(db: Session = Depends(get_db)):
-    return db.query(Ahorro).all()
+def filtros_ahorros(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to"),
+    user_id: Optional[int] = Query(None)
+) -> FiltroAhorros:
+    return FiltroAhorros(limit=limit, cursor=cursor, desde=_limite_fecha(desde), hasta=_limite_fecha(hasta), user_id=user_id)
+
+def _limite_fecha(fecha: Optional[datetime]) -> Optional[datetime]:
+    """Límite from/to en UTC naive, como se guarda ahorros.date (una fecha con zona no pierde su offset)"""
+    if fecha is None:
+        return None
+    try:
+        return _fecha_naive_utc(fecha)
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Fecha fuera de lo soportado")
+
+def _codificar_cursor(fecha: datetime, ahorro_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([fecha.isoformat(), ahorro_id]).encode()).decode()
 
-@app.get("/debug/ahorros")
-def debug_ahorros(db: Session = Depends(get_db)):
-    ahorros = db.query(Ahorro).all()
+def _decodificar_cursor(cursor: str):
+    try:
+        fecha, ahorro_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(fecha), int(ahorro_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+async def _pagina_ahorros(db: AsyncSession, filtros: FiltroAhorros, *columnas):
+    """Página de ahorros ordenada por (date, id) usando paginación por keyset.
+
+    Devuelve las filas y el cursor de la página siguiente (None si es la última).
+    """
+    query = select(*columnas)
+    if filtros.desde:
+        query = query.where(Ahorro.date >= filtros.desde)
+    if filtros.hasta:
+        query = query.where(Ahorro.date < filtros.hasta)
+    if filtros.user_id is not None:
+        query = query.where(Ahorro.user_id == filtros.user_id)
+    if filtros.cursor:
+        query = query.where(tuple_(Ahorro.date, Ahorro.id) > _decodificar_cursor(filtros.cursor))
+
+    resultado = await db.execute(query.order_by(Ahorro.date, Ahorro.id).limit(filtros.limit + 1))
+    # Con la entidad completa se devuelven objetos Ahorro; con columnas, filas
+    filas = resultado.scalars().all() if columnas[0] is Ahorro else resultado.all()
+    if len(filas) <= filtros.limit:
+        return filas, None
+
+    filas = filas[:filtros.limit]
+    return filas, _codificar_cursor(filas[-1].date, filas[-1].id)
+
+@router.get("/ahorros", response_model=List[AhorroResponse])
+async def get_ahorros(
+    request: Request,
+    response: Response,
+    filtros: FiltroAhorros = Depends(filtros_ahorros),
+    db: AsyncSession = Depends(get_db)
+):
+    """Listar ahorros por páginas; la siguiente página se pide con el cursor de X-Next-Cursor"""
+    if no_modificado := await _validar_etag(request, response, "ahorros"):
+        return no_modificado
+
+    ahorros, siguiente = await _pagina_ahorros(db, filtros, Ahorro)
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=siguiente)}>; rel="next"'
+    return ahorros
+
+@router.get("/debug/ahorros")
+async def debug_ahorros(
+    request: Request,
+    response: Response,
+    filtros: FiltroAhorros = Depends(filtros_ahorros),
+    db: AsyncSession = Depends(get_db)
+):
+    if no_modificado := await _validar_etag(request, response, "ahorros"):
+        return no_modificado
+    ahorros, siguiente = await _pagina_ahorros(db, filtros, Ahorro.id, Ahorro.amount, Ahorro.date)
     return {
         "count": len(ahorros),
+        "next_cursor": siguiente,
         "ahorros": [{"id": a.id, "amount": a.amount, "date": str(a.date)} for a in ahorros]
     }
 
-@app.post("/test/add-ahorro")
-def test_add_ahorro(db: Session = Depends(get_db)):
+# ============================================
+# CARGA MASIVA (ARRAY JSON O NDJSON)
+# ============================================
+async def _leer_filas_bulk(request: Request):
+    """Iterar (índice, objeto) del cuerpo: un array JSON o NDJSON leído en streaming"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        pendiente = b""
+        indice = 0
+        async for bloque in request.stream():
+            pendiente += bloque
+            *lineas, pendiente = pendiente.split(b"\n")
+            for linea in lineas:
+                if linea.strip():
+                    yield indice, linea
+                    indice += 1
+        if pendiente.strip():
+            yield indice, pendiente
+        return
+
+    try:
+        filas = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON o NDJSON")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON o NDJSON")
+    for indice, fila in enumerate(filas):
+        yield indice, fila
+
+def _validar_fila(modelo, fila):
+    if isinstance(fila, (bytes, str)):
+        return modelo.model_validate_json(fila)
+    return modelo.model_validate(fila)
+
+def _error_bulk(e: Exception) -> str:
+    """Mensaje corto para el cliente: el error del driver sin la sentencia SQL ni sus parámetros"""
+    if isinstance(e, DBAPIError):
+        return f"{type(e.orig).__name__}: {str(e.orig).splitlines()[0][:200]}"
+    return f"No se pudo guardar la fila ({type(e).__name__})"
+
+async def _procesar_bulk(request: Request, db: AsyncSession, modelo, insertar_lote) -> BulkResponse:
+    """Validar cada fila con el modelo Pydantic e insertar las válidas en lotes de BULK_CHUNK_SIZE.
+
+    Cada lote es una sola transacción; si falla, se reintenta fila por fila para que
+    solo las filas que fallan por sí mismas queden marcadas con error.
+    """
+    resultados = []
+    lote = []
+
+    async def insertar(items) -> List[int]:
+        completados = len(db.info.get("objetivos_completados", []))
+        try:
+            ids = await insertar_lote(db, items)
+            await db.commit()
+            return ids
+        except Exception:
+            await db.rollback()
+            # Los objetivos que marcó este intento se deshicieron con el rollback
+            del db.info.get("objetivos_completados", [])[completados:]
+            raise
+
+    async def vaciar():
+        try:
+            ids = await insertar([item for _, item in lote])
+            resultados.extend(BulkItemResult(index=i, ok=True, id=id_) for (i, _), id_ in zip(lote, ids))
+        except Exception as e:
+            print(f"⚠️ Lote bulk de {len(lote)} filas falló: {e}")
+            if len(lote) == 1:
+                resultados.append(BulkItemResult(index=lote[0][0], ok=False, error=_error_bulk(e)))
+            else:
+                for indice, item in lote:
+                    try:
+                        [id_] = await insertar([item])
+                        resultados.append(BulkItemResult(index=indice, ok=True, id=id_))
+                    except Exception as e_fila:
+                        resultados.append(BulkItemResult(index=indice, ok=False, error=_error_bulk(e_fila)))
+        lote.clear()
+
+    async for indice, fila in _leer_filas_bulk(request):
+        try:
+            lote.append((indice, _validar_fila(modelo, fila)))
+        except ValidationError as e:
+            resultados.append(BulkItemResult(
+                index=indice,
+                ok=False,
+                error="; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err["loc"] else err["msg"]
+                    for err in e.errors()
+                )
+            ))
+            continue
+        if len(lote) >= BULK_CHUNK_SIZE:
+            await vaciar()
+    if lote:
+        await vaciar()
+
+    resultados.sort(key=lambda r: r.index)
+    insertados = sum(1 for r in resultados if r.ok)
+    return BulkResponse(insertados=insertados, rechazados=len(resultados) - insertados, resultados=resultados)
+
+def _fecha_naive_utc(fecha: Optional[datetime]) -> datetime:
+    if fecha is None:
+        return datetime.utcnow()
+    if fecha.tzinfo is not None:
+        return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+async def _insertar_lote_ahorros(db: AsyncSession, items: List[AhorroBulkItem]) -> List[int]:
+    filas = [
+        {"user_id": item.user_id, "monto_id": item.monto_id, "amount": item.amount, "date": _fecha_naive_utc(item.date)}
+        for item in items
+    ]
+    # INSERT multi-fila con RETURNING: los ids salen en el orden de las filas sin recargar objetos
+    ids = (await db.scalars(insert(Ahorro).returning(Ahorro.id, sort_by_parameter_order=True), filas)).all()
+    await _acumular_totales(db, [(f["user_id"], f["date"], f["amount"]) for f in filas])
+    db.info.setdefault("objetivos_completados", []).extend(
+        await _evaluar_objetivos(db, await _total_periodo(db, *PERIODO_HISTORICO))
+    )
+    return ids
+
+async def _insertar_lote_montos(db: AsyncSession, items: List[MontoCreate]) -> List[int]:
+    filas = [{"amount": item.amount, "user_id": item.user_id, "selected": False, "created_at": datetime.utcnow()} for item in items]
+    return (await db.scalars(insert(Monto).returning(Monto.id, sort_by_parameter_order=True), filas)).all()
+
+@router.post("/ahorros/bulk", response_model=BulkResponse)
+async def create_ahorros_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Registrar muchos ahorros (array JSON o NDJSON) en lotes transaccionales"""
+    resultado = await _procesar_bulk(request, db, AhorroBulkItem, _insertar_lote_ahorros)
+
+    completados = db.info.pop("objetivos_completados", None)
+    broker = _estado_de(db).broker
+    if resultado.insertados and broker.hay_suscriptores():
+        broker.publicar("estadisticas", await _calcular_estadisticas(db))
+        if completados:
+            await _publicar_objetivos(db)
+    return resultado
+
+@router.post("/montos/bulk", response_model=BulkResponse)
+async def create_montos_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Registrar muchos montos (array JSON o NDJSON) en lotes transaccionales"""
+    return await _procesar_bulk(request, db, MontoCreate, _insertar_lote_montos)
+
+# ============================================
+# EXPORTACIÓN EN STREAMING (CSV / NDJSON)
+# ============================================
+def _celda(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+async def _stream_export(estado: EstadoApp, stmt, formato: str):
+    """Enviar filas desde un cursor del servidor, un bloque de EXPORT_YIELD_PER filas a la vez.
+
+    Abre su propia sesión porque la respuesta sigue enviándose después de que el endpoint retorna.
+    """
+    columnas = [columna.name for columna in stmt.selected_columns]
+    async with estado.SessionLocal() as db:
+        resultado = await db.stream(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+
+        if formato == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columnas)
+            yield buffer.getvalue()
+
+        async for filas in resultado.partitions():
+            if formato == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([_celda(valor) for valor in fila] for fila in filas)
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps({columna: _celda(valor) for columna, valor in zip(columnas, fila)}) + "\n"
+                    for fila in filas
+                )
+
+def _respuesta_export(request: Request, stmt, formato: str, nombre: str) -> StreamingResponse:
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_export(get_estado(request), stmt, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
+
+@router.get("/export/ahorros")
+async def export_ahorros(
+    request: Request,
+    formato: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to"),
+    user_id: Optional[int] = Query(None)
+):
+    """Exportar el historial completo de ahorros en memoria constante"""
+    stmt = select(Ahorro.id, Ahorro.user_id, Ahorro.monto_id, Ahorro.amount, Ahorro.date)
+    desde, hasta = _limite_fecha(desde), _limite_fecha(hasta)
+    if desde:
+        stmt = stmt.where(Ahorro.date >= desde)
+    if hasta:
+        stmt = stmt.where(Ahorro.date < hasta)
+    if user_id is not None:
+        stmt = stmt.where(Ahorro.user_id == user_id)
+    return _respuesta_export(request, stmt.order_by(Ahorro.date, Ahorro.id), formato, "ahorros")
+
+@router.get("/export/retos")
+async def export_retos(request: Request, formato: str = Query("csv", alias="format", pattern="^(csv|ndjson)$")):
+    """Exportar todos los retos (pool, activos e historial)"""
+    stmt = select(
+        Reto.id, Reto.description, Reto.tipo, Reto.date,
+        Reto.completed_user1, Reto.completed_user2, Reto.penitencia_applied
+    ).order_by(Reto.id)
+    return _respuesta_export(request, stmt, formato, "retos")
+
+@router.post("/test/add-ahorro")
+async def test_add_ahorro(db: AsyncSession = Depends(get_db)):
     ahorro = Ahorro(
         user_id=1,
         monto_id=1,
@@ -336,86 +2000,231 @@ def test_add_ahorro(db: Session = Depends(get_db)):
         date=datetime.now()
     )
     db.add(ahorro)
-    db.commit()
+    await _acumular_totales(db, [(ahorro.user_id, ahorro.date, ahorro.amount)])
+    completados = await _evaluar_objetivos(db, await _total_periodo(db, *PERIODO_HISTORICO))
+    await db.commit()
+    broker = _estado_de(db).broker
+    if broker.hay_suscriptores():
+        broker.publicar("estadisticas", await _calcular_estadisticas(db))
+        if completados:
+            await _publicar_objetivos(db)
     return {"message": "Ahorro de prueba creado", "amount": 500000.0}
 
-@app.get("/estadisticas", response_model=EstadisticasResponse)
-def get_estadisticas(db: Session = Depends(get_db)):
-    total_general_result = db.query(func.sum(Ahorro.amount)).scalar()
-    total_general = float(total_general_result) if total_general_result is not None else 0.0
-    
+@router.get("/estadisticas", response_model=EstadisticasResponse)
+async def get_estadisticas(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    mes = datetime.now().strftime("%Y-%m")
+    if no_modificado := await _validar_etag(request, response, "ahorro_totales", variante=mes):
+        return no_modificado
+    return await _leer_cacheado(request, "estadisticas", ("ahorro_totales",), lambda: _calcular_estadisticas(db), variante=mes)
+
+async def _calcular_estadisticas(db: AsyncSession) -> EstadisticasResponse:
     now = datetime.now()
-    primer_dia_mes = datetime(now.year, now.month, 1)
-    
-    if now.month == 12:
-        ultimo_dia_mes = datetime(now.year + 1, 1, 1)
-    else:
-        ultimo_dia_mes = datetime(now.year, now.month + 1, 1)
-    
-    total_mes_result = db.query(func.sum(Ahorro.amount)).filter(
-        Ahorro.date >= primer_dia_mes,
-        Ahorro.date < ultimo_dia_mes
-    ).scalar()
-    total_mes = float(total_mes_result) if total_mes_result is not None else 0.0
+    # Una sola lectura de ahorro_totales: filas del mes y del histórico, de la pareja y de cada usuario
+    filas = (await db.execute(
+        select(AhorroTotal.year, AhorroTotal.month, AhorroTotal.user_id, AhorroTotal.total, AhorroTotal.count)
+        .where(tuple_(AhorroTotal.year, AhorroTotal.month).in_([(now.year, now.month), PERIODO_HISTORICO]))
+    )).all()
+    totales = {(year, month, uid): (float(total), count) for year, month, uid, total, count in filas}
+    total_general = totales.get((*PERIODO_HISTORICO, TOTAL_PAREJA), (0.0, 0))[0]
+    total_mes = totales.get((now.year, now.month, TOTAL_PAREJA), (0.0, 0))[0]
     
     objetivo_mes = 2000000.0
     faltante_mes = max(0.0, objetivo_mes - total_mes)
     
-    objetivos = [1000000, 2000000, 3000000, 5000000, 7000000, 12000000, 20000000]
     objetivo_actual = 20000000.0
-    for obj in objetivos:
+    for obj in OBJETIVOS_AMOUNTS:
         if total_general < obj:
             objetivo_actual = float(obj)
             break
     
     progreso_porcentaje = (total_general / objetivo_actual * 100) if objetivo_actual > 0 else 0.0
     
+    por_usuario = []
+    for uid in sorted({uid for _, _, uid in totales if uid != TOTAL_PAREJA}):
+        usuario_mes, count_mes = totales.get((now.year, now.month, uid), (0.0, 0))
+        usuario_general, count_general = totales.get((*PERIODO_HISTORICO, uid), (0.0, 0))
+        por_usuario.append(EstadisticasUsuario(
+            user_id=uid,
+            total_mes=usuario_mes,
+            count_mes=count_mes,
+            promedio_mes=usuario_mes / count_mes if count_mes else 0.0,
+            total_general=usuario_general,
+            count_general=count_general,
+            promedio_general=usuario_general / count_general if count_general else 0.0,
+            porcentaje_general=(usuario_general / total_general * 100) if total_general > 0 else 0.0
+        ))
+    
     return EstadisticasResponse(
         total_mes=total_mes,
         faltante_mes=faltante_mes,
         total_general=total_general,
         objetivo_actual=objetivo_actual,
-        progreso_porcentaje=progreso_porcentaje
+        progreso_porcentaje=progreso_porcentaje,
+        por_usuario=por_usuario
     )
 
-@app.get("/objetivos", response_model=List[ObjetivoResponse])
-def get_objetivos(db: Session = Depends(get_db)):
-    objetivos = db.query(Objetivo).all()
-
-    if not objetivos:
-        objetivos_amounts = [
-            1_000_000,
-            2_000_000,
-            3_000_000,
-            5_000_000,
-            7_000_000,
-            12_000_000,
-            20_000_000
-        ]
-
-        for amount in objetivos_amounts:
-            db.add(Objetivo(amount=amount))
-
-        db.commit()
-        objetivos = db.query(Objetivo).all()
+# ============================================
+# SERIES DE AHORRO (AGRUPADAS EN SQL)
+# ============================================
+def _expresion_periodo(dialecto: str, granularidad: str):
+    """Inicio del periodo de ahorros.date (día, semana desde el lunes o mes), calculado en SQL"""
+    if dialecto == "postgresql":
+        return cast(func.date_trunc(granularidad, Ahorro.date), Date)
+    modificadores = {"day": (), "week": ("weekday 0", "-6 days"), "month": ("start of month",)}
+    return func.date(Ahorro.date, *modificadores[granularidad])
+
+def _inicio_periodo(dia: date, granularidad: str) -> date:
+    if granularidad == "week":
+        return dia - timedelta(days=dia.weekday())
+    if granularidad == "month":
+        return dia.replace(day=1)
+    return dia
+
+def _siguiente_periodo(inicio: date, granularidad: str) -> date:
+    if granularidad == "week":
+        return inicio + timedelta(days=7)
+    if granularidad == "month":
+        return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio + timedelta(days=1)
+
+def _cantidad_periodos(desde: datetime, hasta: datetime, granularidad: str) -> int:
+    if granularidad == "month":
+        return (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+    dias = (hasta - desde).days + 1
+    return dias // 7 + 2 if granularidad == "week" else dias
+
+async def _serie_ahorros(db: AsyncSession, granularidad: str, desde: datetime, hasta: datetime, user_id: Optional[int]) -> dict:
+    """Totales por periodo y usuario, acumulados y proyección de objetivos.
+
+    Los ahorros se agrupan con un solo GROUP BY (periodo, user_id) sobre el rango de fechas; el
+    acumulado previo al rango sale de ahorro_totales. Python solo recorre los periodos.
+    """
+    periodo = _expresion_periodo(db.bind.dialect.name, granularidad).label("periodo")
+    filas = (await db.execute(
+        select(periodo, Ahorro.user_id, func.sum(Ahorro.amount), func.count(Ahorro.id))
+        .where(Ahorro.date >= desde, Ahorro.date < hasta)
+        .group_by(periodo, Ahorro.user_id)
+    )).all()
+    # Lo ahorrado desde el inicio del rango (incluye lo posterior a hasta), para descontarlo del histórico
+    desde_inicio = dict((await db.execute(
+        select(Ahorro.user_id, func.sum(Ahorro.amount)).where(Ahorro.date >= desde).group_by(Ahorro.user_id)
+    )).all())
+
+    buckets = {}
+    total_pareja = 0.0
+    for inicio, uid, total, count in filas:
+        total = float(total or 0.0)
+        total_pareja += total
+        if user_id is not None and uid != user_id:
+            continue
+        bucket = buckets.setdefault(date.fromisoformat(str(inicio)), {"total": 0.0, "count": 0, "por_usuario": {}})
+        bucket["total"] += total
+        bucket["count"] += count
+        bucket["por_usuario"][uid] = bucket["por_usuario"].get(uid, 0.0) + total
+
+    historico = await _total_periodo(db, *PERIODO_HISTORICO, user_id if user_id is not None else TOTAL_PAREJA)
+    if user_id is not None:
+        previo = historico - float(desde_inicio.get(user_id) or 0.0)
+    else:
+        previo = historico - sum(float(total or 0.0) for total in desde_inicio.values())
+
+    # Periodos sin ahorros también aparecen, con total 0, para que la gráfica sea continua
+    serie = []
+    acumulado = previo
+    inicio = _inicio_periodo(desde.date(), granularidad)
+    ultimo = (hasta - timedelta(microseconds=1)).date()
+    while inicio <= ultimo:
+        bucket = buckets.get(inicio, {"total": 0.0, "count": 0, "por_usuario": {}})
+        acumulado += bucket["total"]
+        serie.append({"periodo": inicio, "acumulado": acumulado, **bucket})
+        inicio = _siguiente_periodo(inicio, granularidad)
+
+    # Proyección con el ritmo diario de la pareja en el rango
+    total_general = await _total_periodo(db, *PERIODO_HISTORICO)
+    ritmo = total_pareja / max((hasta - desde).total_seconds() / 86400, 1.0)
+    hoy = datetime.utcnow().date()
+    proyeccion = []
+    for objetivo in (await db.scalars(select(Objetivo).order_by(Objetivo.amount))).all():
+        if objetivo.completed:
+            fecha = objetivo.completed_at.date() if objetivo.completed_at else None
+        elif objetivo.amount <= total_general:
+            fecha = hoy
+        elif ritmo > 0:
+            dias = math.ceil((objetivo.amount - total_general) / ritmo)
+            # Con un ritmo muy bajo la fecha cae después de date.max: no hay fecha estimada
+            fecha = hoy + timedelta(days=dias) if dias <= (date.max - hoy).days else None
+        else:
+            fecha = None
+        proyeccion.append({
+            "objetivo_id": objetivo.id,
+            "amount": objetivo.amount,
+            "completed": objetivo.completed,
+            "fecha_estimada": fecha
+        })
 
-    total_general = db.query(func.sum(Ahorro.amount)).scalar() or 0
+    return {
+        "granularity": granularidad,
+        "desde": desde,
+        "hasta": hasta,
+        "user_id": user_id,
+        "total": sum(bucket["total"] for bucket in serie),
+        "buckets": serie,
+        "proyeccion": proyeccion
+    }
 
-    for objetivo in objetivos:
-        if total_general >= objetivo.amount and not objetivo.completed:
-            objetivo.completed = True
-            objetivo.completed_at = datetime.utcnow()
+@router.get("/estadisticas/series", response_model=SerieEstadisticasResponse)
+async def get_estadisticas_series(
+    request: Request,
+    response: Response,
+    granularity: str = Query("month", pattern="^(day|week|month)$"),
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to", description="Exclusivo; por defecto ahora"),
+    user_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Ahorros agrupados por día, semana o mes (UTC), con acumulado y proyección de objetivos"""
+    # Fechas con zona horaria y sin ella se comparan en UTC naive, como se guardan
+    hasta = _fecha_naive_utc(hasta)
+    # Un periodo de margen en cada extremo para que el recorrido no salga del rango de date
+    if hasta.year >= date.max.year or (desde is not None and _fecha_naive_utc(desde).year <= date.min.year):
+        raise HTTPException(status_code=400, detail="Rango de fechas fuera de lo soportado")
+    desde = _fecha_naive_utc(desde) if desde else max(hasta - timedelta(days=365), datetime(date.min.year + 1, 1, 1))
+    if desde >= hasta:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+    if _cantidad_periodos(desde, hasta, granularity) > SERIES_MAX_PERIODOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El rango tiene más de {SERIES_MAX_PERIODOS} periodos con granularity={granularity}; acorta el rango o usa una granularidad mayor"
+        )
 
-    db.commit()
+    # Sin 'to' explícito el rango avanza cada día
+    dia = datetime.utcnow().strftime("%Y-%m-%d")
+    if no_modificado := await _validar_etag(request, response, "ahorros", "objetivos", variante=dia):
+        return no_modificado
+    variante = f"{granularity}:{desde.isoformat()}:{hasta.isoformat()}:{user_id}"
+    return await _leer_cacheado(
+        request, "series", ("ahorros", "objetivos"),
+        lambda: _serie_ahorros(db, granularity, desde, hasta, user_id),
+        variante=variante, ttl=60
+    )
 
-    return objetivos
+@router.get("/objetivos", response_model=List[ObjetivoResponse])
+async def get_objetivos(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """Lectura pura: los objetivos se completan al registrar ahorros, no al consultarlos"""
+    if no_modificado := await _validar_etag(request, response, "objetivos"):
+        return no_modificado
+    return await _leer_cacheado(request, "objetivos", ("objetivos",), lambda: _scalars(db, select(Objetivo).order_by(Objetivo.amount)))
 
-@app.get("/retos", response_model=List[RetoResponse])
-def get_retos(db: Session = Depends(get_db)):
+@router.get("/retos", response_model=List[RetoResponse])
+async def get_retos(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Obtener historial de retos COMPLETADOS o EXPIRADOS"""
-    now = datetime.now()
-    
-    retos_historial = db.query(Reto).filter(
+    minuto = _minuto_actual()
+    if no_modificado := await _validar_etag(request, response, "retos", variante=minuto):
+        return no_modificado
+    return await _leer_cacheado(request, "retos", ("retos",), lambda: _retos_historial(db, datetime.now()), variante=minuto, ttl=60)
+
+async def _retos_historial(db: AsyncSession, now: datetime) -> List[Reto]:
+    return (await db.scalars(select(Reto).where(
         and_(
             Reto.date.isnot(None),
             or_(
@@ -426,16 +2235,20 @@ def get_retos(db: Session = Depends(get_db)):
                 )
             )
         )
-    ).order_by(Reto.date.desc()).all()
-    
-    return retos_historial
+    ).order_by(Reto.date.desc()))).all()
 
-@app.get("/retos/actual")
-def get_reto_actual(db: Session = Depends(get_db)):
+@router.get("/retos/actual")
+async def get_reto_actual(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Obtener el reto activo actual (si existe)"""
-    now = datetime.now()
-    
-    reto = db.query(Reto).filter(
+    minuto = _minuto_actual()
+    if no_modificado := await _validar_etag(request, response, "retos", variante=minuto):
+        return no_modificado
+    reto = await _leer_cacheado(request, "reto_actual", ("retos",), lambda: _reto_actual(db, datetime.now()), variante=minuto, ttl=60)
+    return {"reto": reto}
+
+async def _reto_actual(db: AsyncSession, now: datetime) -> Optional[Reto]:
+    """Reto activado en las últimas 24 horas que alguno de los dos no ha completado"""
+    return await db.scalar(select(Reto).where(
         and_(
             Reto.date.isnot(None),
             Reto.date >= now - timedelta(hours=24),
@@ -444,42 +2257,31 @@ def get_reto_actual(db: Session = Depends(get_db)):
                 Reto.completed_user2 == False
             )
         )
-    ).order_by(Reto.date.desc()).first()
-    
-    if reto:
-        return {"reto": reto}
-    
-    return {"reto": None}
+    ).order_by(Reto.date.desc()).limit(1))
 
-@app.get("/retos/disponibles")
-def get_retos_disponibles(db: Session = Depends(get_db)):
+@router.get("/retos/disponibles")
+async def get_retos_disponibles(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Obtener retos que aún no han sido usados"""
-    retos_disponibles = db.query(Reto).filter(Reto.date.is_(None)).all()
+    if no_modificado := await _validar_etag(request, response, "retos"):
+        return no_modificado
+    retos_disponibles = await _leer_cacheado(request, "retos_disponibles", ("retos",), lambda: _retos_disponibles(db))
     return {"retos_disponibles": retos_disponibles, "total": len(retos_disponibles)}
 
-@app.get("/retos/proximo")
-def get_proximo_reto_info(db: Session = Depends(get_db)):
+async def _retos_disponibles(db: AsyncSession) -> List[Reto]:
+    return (await db.scalars(select(Reto).where(Reto.date.is_(None)))).all()
+
+@router.get("/retos/proximo")
+async def get_proximo_reto_info(request: Request, response: Response):
     """Obtener información sobre el próximo reto automático"""
-    now = datetime.now()
-    current_day = now.day
-    
-    # Calcular próxima fecha de activación
-    if current_day < 1:
-        next_date = datetime(now.year, now.month, 1, 0, 0, 0)
-        tipo = "day_1"
-    elif current_day >= 1 and current_day < 15:
-        next_date = datetime(now.year, now.month, 15, 0, 0, 0)
-        tipo = "day_15"
-    else:
-        # Próximo mes, día 1
-        if now.month == 12:
-            next_date = datetime(now.year + 1, 1, 1, 0, 0, 0)
-        else:
-            next_date = datetime(now.year, now.month + 1, 1, 0, 0, 0)
-        tipo = "day_1"
+    # Misma fecha que usará el scheduler, calculada de sus CronTrigger en hora de Bogotá
+    calendario_retos = get_estado(request).calendario_retos
+    next_date, tipo = calendario_retos.proxima(datetime.now(colombia_tz))
+    if no_modificado := await _validar_etag(request, response, "retos", variante=next_date.isoformat()):
+        return no_modificado
     
-    # Verificar si hay retos disponibles
-    retos_disponibles = db.query(Reto).filter(Reto.date.is_(None)).count()
+    # Conteo en caché mientras no cambie la tabla retos, con la versión que ya leyó el ETag
+    version = (await _versiones_de(request, ("retos",)))["retos"]
+    retos_disponibles = await calendario_retos.disponibles(version)
     
     return {
         "next_activation_date": next_date,
@@ -488,44 +2290,116 @@ def get_proximo_reto_info(db: Session = Depends(get_db)):
         "automatic_activation": True
     }
 
-@app.post("/retos/activar")
-def activar_reto_aleatorio(db: Session = Depends(get_db)):
+# ============================================
+# DASHBOARD (TODAS LAS LECTURAS EN UNA PETICIÓN)
+# ============================================
+# Sección -> tablas de las que depende su ETag
+SECCIONES_DASHBOARD = {
+    "estadisticas": ("ahorro_totales",),
+    "objetivos": ("objetivos",),
+    "retos": ("retos",),
+    "reto_actual": ("retos",),
+    "retos_disponibles": ("retos",),
+    "proximo_reto": ("retos",),
+    "users": ("users",),
+    "montos": ("montos",),
+}
+SECCIONES_POR_MINUTO = {"retos", "reto_actual"}
+
+def _secciones_dashboard(fields: Optional[str] = Query(None, description="Secciones separadas por coma; vacío = todas")) -> List[str]:
+    if not fields:
+        return list(SECCIONES_DASHBOARD)
+    secciones = [campo.strip() for campo in fields.split(",") if campo.strip()]
+    desconocidas = [campo for campo in secciones if campo not in SECCIONES_DASHBOARD]
+    if desconocidas:
+        raise HTTPException(status_code=400, detail=f"Secciones desconocidas: {', '.join(desconocidas)}")
+    return secciones
+
+@router.get("/dashboard", response_model=DashboardResponse, response_model_exclude_unset=True)
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    secciones: List[str] = Depends(_secciones_dashboard),
+    db: AsyncSession = Depends(get_db)
+):
+    """Todo lo que muestra el dashboard en una sola sesión y una sola transacción de lectura"""
+    now = datetime.now()
+    proxima = get_estado(request).calendario_retos.proxima(datetime.now(colombia_tz))
+
+    tablas = sorted({tabla for seccion in secciones for tabla in SECCIONES_DASHBOARD[seccion]})
+    variantes = []
+    if "estadisticas" in secciones:
+        variantes.append(now.strftime("%Y-%m"))
+    if "proximo_reto" in secciones:
+        variantes.append(proxima[0].isoformat())
+    if SECCIONES_POR_MINUTO.intersection(secciones):
+        variantes.append(_minuto_actual())
+    if no_modificado := await _validar_etag(request, response, *tablas, variante="-".join(variantes)):
+        return no_modificado
+
+    async def armar_dashboard():
+        return await _armar_dashboard(db, secciones, now, proxima)
+
+    variante = ",".join(secciones + variantes)
+    ttl = 60 if SECCIONES_POR_MINUTO.intersection(secciones) else None
+    return await _leer_cacheado(request, "dashboard", tuple(tablas), armar_dashboard, variante=variante, ttl=ttl)
+
+async def _armar_dashboard(db: AsyncSession, secciones: List[str], now: datetime, proxima) -> dict:
+    await _instantanea_de_lectura(db)
+    dashboard = {}
+    if "estadisticas" in secciones:
+        dashboard["estadisticas"] = await _calcular_estadisticas(db)
+    if "objetivos" in secciones:
+        dashboard["objetivos"] = (await db.scalars(select(Objetivo).order_by(Objetivo.amount))).all()
+    if "retos" in secciones:
+        dashboard["retos"] = await _retos_historial(db, now)
+    if "reto_actual" in secciones:
+        dashboard["reto_actual"] = await _reto_actual(db, now)
+    if "retos_disponibles" in secciones:
+        dashboard["retos_disponibles"] = await _retos_disponibles(db)
+    if "proximo_reto" in secciones:
+        # Si ya se cargó el pool, su tamaño sale de ahí sin otra consulta
+        if "retos_disponibles" in dashboard:
+            total_disponibles = len(dashboard["retos_disponibles"])
+        else:
+            estado = _estado_de(db)
+            version = (await estado.versiones.leer("retos", db=db))["retos"]
+            total_disponibles = await estado.calendario_retos.disponibles(version, db)
+        dashboard["proximo_reto"] = {
+            "next_activation_date": proxima[0],
+            "activation_type": proxima[1],
+            "retos_disponibles": total_disponibles,
+            # exclude_unset omitiría el valor por defecto del modelo
+            "automatic_activation": True,
+        }
+    if "users" in secciones:
+        dashboard["users"] = (await db.scalars(select(User))).all()
+    if "montos" in secciones:
+        dashboard["montos"] = (await db.scalars(select(Monto))).all()
+    return dashboard
+
+@router.post("/retos/activar")
+async def activar_reto_aleatorio(db: AsyncSession = Depends(get_db)):
     """Activar un reto manualmente (para pruebas)"""
     now = datetime.now()
     
-    # Verificar si ya existe un reto activo
-    reto_activo = db.query(Reto).filter(
-        and_(
-            Reto.date.isnot(None),
-            Reto.date >= now - timedelta(hours=24)
-        )
-    ).first()
-    
-    if reto_activo:
-        return {"message": "Ya existe un reto activo", "reto": reto_activo}
-    
-    # Obtener retos disponibles
-    retos_disponibles = db.query(Reto).filter(Reto.date.is_(None)).all()
+    # Registrar la activación del día y reclamar un reto del pool en la misma transacción
+    estado, reto_seleccionado = await _activar_reto(db, now, "manual")
     
-    if not retos_disponibles:
+    if estado == "ya_activado":
+        return {"message": "Ya se activó un reto hoy", "reto": await _reto_activo_reciente(db, now)}
+    if estado == "activo":
+        return {"message": "Ya existe un reto activo", "reto": reto_seleccionado}
+    if estado == "sin_retos":
         raise HTTPException(status_code=404, detail="No hay retos disponibles")
     
-    # Seleccionar uno aleatorio
-    reto_seleccionado = choice(retos_disponibles)
-    
-    # Activarlo
-    reto_seleccionado.date = now
-    reto_seleccionado.completed_user1 = False
-    reto_seleccionado.completed_user2 = False
-    reto_seleccionado.penitencia_applied = False
-    
-    db.commit()
-    db.refresh(reto_seleccionado)
+    await db.commit()
+    await _publicar_reto(db, "activado", reto_seleccionado)
     
     return {"message": "Reto activado manualmente", "reto": reto_seleccionado}
 
-@app.post("/retos/crear")
-def crear_reto(description: str = Query(...), tipo: str = Query("ahorro"), db: Session = Depends(get_db)):
+@router.post("/retos/crear")
+async def crear_reto(description: str = Query(...), tipo: str = Query("ahorro"), db: AsyncSession = Depends(get_db)):
     """Crear un nuevo reto en el pool"""
     reto = Reto(
         description=description,
@@ -536,14 +2410,17 @@ def crear_reto(description: str = Query(...), tipo: str = Query("ahorro"), db: S
         penitencia_applied=False
     )
     db.add(reto)
-    db.commit()
-    db.refresh(reto)
+    await db.commit()
+    await db.refresh(reto)
+    broker = _estado_de(db).broker
+    if broker.hay_suscriptores():
+        broker.publicar("retos_disponibles", {"total": await _contar_retos_disponibles(db)})
     return reto
 
-@app.post("/retos/{reto_id}/complete")
-def complete_reto(reto_id: int, user_id: int = Query(...), db: Session = Depends(get_db)):
+@router.post("/retos/{reto_id}/complete")
+async def complete_reto(reto_id: int, user_id: int = Query(...), db: AsyncSession = Depends(get_db)):
     """Marcar reto como completado por un usuario"""
-    reto = db.query(Reto).filter(Reto.id == reto_id).first()
+    reto = await db.get(Reto, reto_id)
     if not reto:
         raise HTTPException(status_code=404, detail="Reto not found")
     
@@ -559,8 +2436,9 @@ def complete_reto(reto_id: int, user_id: int = Query(...), db: Session = Depends
     else:
         raise HTTPException(status_code=400, detail="Usuario inválido")
     
-    db.commit()
-    db.refresh(reto)
+    await db.commit()
+    await db.refresh(reto)
+    await _publicar_reto(db, "completado", reto)
     
     return {
         "message": "Reto completado",
@@ -568,77 +2446,180 @@ def complete_reto(reto_id: int, user_id: int = Query(...), db: Session = Depends
         "ambos_completados": reto.completed_user1 and reto.completed_user2
     }
 
-@app.post("/retos/{reto_id}/aplicar-penitencia")
-def aplicar_penitencia(reto_id: int, db: Session = Depends(get_db)):
+@router.post("/retos/{reto_id}/aplicar-penitencia")
+async def aplicar_penitencia(reto_id: int, db: AsyncSession = Depends(get_db)):
     """Marcar que se aplicó penitencia al reto"""
-    reto = db.query(Reto).filter(Reto.id == reto_id).first()
+    reto = await db.get(Reto, reto_id)
     if not reto:
         raise HTTPException(status_code=404, detail="Reto not found")
     
     reto.penitencia_applied = True
-    db.commit()
+    await db.commit()
+    await _publicar_reto(db, "penitencia", reto)
     
     return {"message": "Penitencia aplicada"}
 
-@app.get("/penitencias")
-def get_penitencias(db: Session = Depends(get_db)):
+@router.get("/penitencias")
+async def get_penitencias(request: Request, response: Response):
     """Obtener todas las penitencias disponibles"""
-    penitencias = db.query(Penitencia).all()
-    return {"penitencias": [p.description for p in penitencias]}
+    if no_modificado := await _validar_etag(request, response, "penitencias"):
+        return no_modificado
+    version = (await _versiones_de(request, ("penitencias",)))["penitencias"]
+    return {"penitencias": await get_estado(request).pool_penitencias.descripciones(version)}
 
-@app.get("/penitencias/random")
-def get_penitencia_aleatoria(db: Session = Depends(get_db)):
+@router.get("/penitencias/random")
+async def get_penitencia_aleatoria(request: Request, modo: str = Query(PENITENCIA_MODO, description="uniforme, ponderado o sin_repetir")):
     """Obtener una penitencia aleatoria"""
-    penitencias = db.query(Penitencia).all()
-    if not penitencias:
+    if modo not in MODOS_PENITENCIA:
+        raise HTTPException(status_code=400, detail=f"Modo inválido: {modo}")
+    
+    # Una consulta por clave primaria: así se ven las penitencias cargadas desde otro worker
+    version = (await _versiones_de(request, ("penitencias",)))["penitencias"]
+    penitencia = await get_estado(request).pool_penitencias.sortear(version, modo)
+    if penitencia is None:
         raise HTTPException(status_code=404, detail="No hay penitencias disponibles")
     
-    penitencia = choice(penitencias)
-    return {"penitencia": penitencia.description}
+    return {"penitencia": penitencia}
 
-@app.post("/init")
-def init_db(db: Session = Depends(get_db)):
+@router.post("/init")
+async def init_db(db: AsyncSession = Depends(get_db)):
     """Inicializar la base de datos con datos básicos"""
     # Crear usuarios si no existen
-    user1 = db.query(User).filter(User.id == 1).first()
+    user1 = await db.get(User, 1)
     if not user1:
         user1 = User(name="Persona 1", color="person1")
         db.add(user1)
     
-    user2 = db.query(User).filter(User.id == 2).first()
+    user2 = await db.get(User, 2)
     if not user2:
         user2 = User(name="Persona 2", color="person2")
         db.add(user2)
     
     # Crear objetivos si no existen
-    objetivos = db.query(Objetivo).all()
-    if not objetivos:
-        objetivos_amounts = [1000000, 2000000, 3000000, 5000000, 7000000, 12000000, 20000000]
-        for amount in objetivos_amounts:
-            objetivo = Objetivo(amount=amount)
-            db.add(objetivo)
+    await _sembrar_objetivos(db)
     
-    db.commit()
+    await db.commit()
     return {"message": "Database initialized"}
 
-@app.get("/scheduler/status")
-def get_scheduler_status():
+@router.get("/events")
+async def stream_eventos(request: Request):
+    """Stream SSE con los cambios de estadísticas, objetivos y retos (reemplaza el polling)"""
+    broker = get_estado(request).broker
+    cola = broker.suscribir()
+
+    async def generar():
+        # uvicorn espera a que se cierren las conexiones antes de apagarse: un stream sin fin
+        # dejaría colgado cada deploy mientras haya una pestaña abierta
+        fin = time.monotonic() + SSE_MAX_SEGUNDOS
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    yield await asyncio.wait_for(cola.get(), timeout=min(SSE_KEEPALIVE_SEGUNDOS, restante))
+                except asyncio.TimeoutError:
+                    # Comentario SSE para mantener viva la conexión a través de proxies
+                    yield ": keepalive\n\n"
+        finally:
+            broker.cancelar(cola)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/scheduler/status")
+async def get_scheduler_status(request: Request):
     """Verificar el estado del scheduler"""
-    jobs = scheduler.get_jobs()
+    from apscheduler.schedulers.base import STATE_RUNNING
+    estado = get_estado(request)
+    scheduler = estado.scheduler
+    activo = scheduler is not None and scheduler.running
     return {
-        "scheduler_running": scheduler.running,
+        "scheduler_running": activo and scheduler.state == STATE_RUNNING,
+        "scheduler_mode": estado.settings.scheduler_mode,
+        "scheduler_owner": estado.owner,
         "jobs": [
             {
                 "id": job.id,
                 "name": job.name,
                 "next_run_time": str(job.next_run_time) if job.next_run_time else None
             }
-            for job in jobs
+            for job in (scheduler.get_jobs() if activo else [])
         ]
     }
 
-@app.post("/scheduler/test-activacion")
-def test_activacion_inmediata(db: Session = Depends(get_db)):
+@router.get("/metrics")
+async def get_metrics(request: Request):
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    estado = get_estado(request)
+    return Response(estado.metricas.exportar(estado.engine), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.post("/scheduler/test-activacion")
+async def test_activacion_inmediata(request: Request):
     """Endpoint de prueba para activar el reto inmediatamente (simular el scheduler)"""
-    activar_reto_automatico()
-    return {"message": "Función de activación ejecutada manualmente"}
\ No newline at end of file
+    await activar_reto_automatico(estado=get_estado(request))
+    return {"message": "Función de activación ejecutada manualmente"}
+
+# ============================================
+# APP
+# ============================================
+async def _base_bloqueada(request: Request, exc: OperationalError):
+    """SQLite sin turno para escribir: 503 reintentable en vez de un 500 genérico"""
+    if "database is locked" not in str(exc.orig):
+        raise exc
+    print(f"🔒 Base de datos bloqueada en {request.method} {request.url.path}")
+    return JSONResponse(status_code=503, content={"detail": "database is locked"}, headers={"Retry-After": "1"})
+
+def _finito_o_texto(valor: float):
+    return valor if math.isfinite(valor) else str(valor)
+
+async def _validacion_invalida(request: Request, exc: RequestValidationError):
+    """422 como el de FastAPI, pero un NaN o Infinity rechazado se devuelve como texto (JSON no los admite)"""
+    errores = jsonable_encoder(exc.errors(), custom_encoder={float: _finito_o_texto})
+    return JSONResponse(status_code=422, content={"detail": errores})
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Construir una instancia de la API.
+
+    Importar el módulo o llamar a create_app no abre conexiones ni arranca nada: el engine, el
+    esquema, la caché y el scheduler se preparan en el lifespan. Con
+    Settings(database_url="sqlite:///:memory:", scheduler_mode="off") se obtiene una instancia
+    aislada para pruebas y benchmarks.
+    """
+    settings = settings or Settings()
+    estado = EstadoApp(settings)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await iniciar_servidor(estado)
+        try:
+            yield
+        finally:
+            await detener_servidor(estado)
+
+    app = FastAPI(title="Ahorro 2026 API", lifespan=lifespan)
+    app.state.settings = settings
+    app.state.estado = estado
+
+    # CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor", "Link", "Server-Timing"],
+    )
+    if settings.sql_profile:
+        app.add_middleware(PerfilSQLMiddleware)
+    app.add_middleware(MetricasMiddleware, metricas=estado.metricas)
+    app.add_exception_handler(OperationalError, _base_bloqueada)
+    app.add_exception_handler(RequestValidationError, _validacion_invalida)
+    app.include_router(router)
+    return app
+
+app = create_app()
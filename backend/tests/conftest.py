@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from main import Settings, create_app  # noqa: E402
+
+
+def crear_cliente(**config) -> TestClient:
+    """App propia sin scheduler; por defecto sobre sqlite:///:memory:"""
+    settings = Settings(**{"database_url": "sqlite:///:memory:", "scheduler_mode": "off", "cache_backend": "memory", **config})
+    return TestClient(create_app(settings))
+
+
+@pytest.fixture
+def client():
+    with crear_cliente() as client:
+        client.post("/init").raise_for_status()
+        yield client
+
+
+class ContadorSQL:
+    """Cuenta las sentencias que la app envía a la base"""
+
+    def __init__(self, client: TestClient):
+        from sqlalchemy import event
+
+        self.sentencias = []
+        event.listen(client.app.state.estado.engine.sync_engine, "before_cursor_execute", self._registrar)
+
+    def _registrar(self, conn, cursor, sentencia, parametros, context, executemany):
+        self.sentencias.append(sentencia)
+
+    def reiniciar(self):
+        self.sentencias.clear()
+
+
+@pytest.fixture
+def contador_sql(client):
+    return ContadorSQL(client)
@@ -0,0 +1,21 @@
+from datetime import datetime
+
+
+def _registrar(client, fecha: datetime):
+    client.post("/ahorros/bulk", json=[{"user_id": 1, "monto_id": 1, "amount": 1000.0, "date": fecha.isoformat()}]).raise_for_status()
+
+
+def test_filtro_con_zona_horaria_se_compara_en_utc(client):
+    # 03:00 UTC del 1 de enero = 22:00 del 31 de diciembre en Bogotá
+    _registrar(client, datetime(2026, 1, 1, 3, 0))
+    _registrar(client, datetime(2026, 1, 1, 6, 0))
+
+    pagina = client.get("/ahorros", params={"from": "2026-01-01T00:00:00-05:00"})
+    assert [a["date"] for a in pagina.json()] == ["2026-01-01T06:00:00"]
+
+    export = client.get("/export/ahorros", params={"format": "ndjson", "to": "2026-01-01T00:00:00-05:00"})
+    assert export.text.count("\n") == 1 and "2026-01-01T03:00:00" in export.text
+
+
+def test_filtro_fuera_de_rango_responde_400(client):
+    assert client.get("/ahorros", params={"from": "0001-01-01T00:00:00+05:00"}).status_code == 400
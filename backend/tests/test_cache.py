@@ -0,0 +1,32 @@
+import pytest
+
+from conftest import crear_cliente
+
+
+@pytest.mark.parametrize("cache_backend", ["memory", "fake"])
+def test_escritura_invalida_etag_y_cache(cache_backend):
+    with crear_cliente(cache_backend=cache_backend) as client:
+        client.post("/init").raise_for_status()
+        antes = client.get("/estadisticas")
+        assert client.get("/estadisticas", headers={"If-None-Match": antes.headers["etag"]}).status_code == 304
+
+        client.post("/ahorros", json={"user_id": 1, "monto_id": 1, "amount": 1000.0}).raise_for_status()
+
+        despues = client.get("/estadisticas", headers={"If-None-Match": antes.headers["etag"]})
+        assert despues.status_code == 200
+        assert despues.headers["etag"] != antes.headers["etag"]
+        assert despues.json()["total_general"] == antes.json()["total_general"] + 1000
+
+
+def test_escritura_en_otro_worker_invalida_etag_y_cache(tmp_path):
+    # Dos instancias sobre la misma base, como dos workers de uvicorn con CACHE_BACKEND=memory
+    url = f"sqlite:///{tmp_path / 'ahorro.db'}"
+    with crear_cliente(database_url=url) as worker_a, crear_cliente(database_url=url) as worker_b:
+        worker_a.post("/init").raise_for_status()
+        antes = worker_b.get("/estadisticas")
+
+        worker_a.post("/ahorros", json={"user_id": 2, "monto_id": 1, "amount": 3000.0}).raise_for_status()
+
+        despues = worker_b.get("/estadisticas", headers={"If-None-Match": antes.headers["etag"]})
+        assert despues.status_code == 200
+        assert despues.json()["total_general"] == antes.json()["total_general"] + 3000
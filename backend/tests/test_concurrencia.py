@@ -0,0 +1,31 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import func, select
+
+import main
+from conftest import crear_cliente
+
+
+async def _activar_a_la_vez(app, veces: int):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await asyncio.gather(*(client.post("/retos/activar") for _ in range(veces)))
+
+
+async def _retos_activos(estado):
+    async with estado.SessionLocal() as db:
+        return await db.scalar(select(func.count(main.Reto.id)).where(main.Reto.date >= datetime.now() - timedelta(days=1)))
+
+
+def test_activaciones_concurrentes_dejan_un_solo_reto_activo(tmp_path):
+    # Base en archivo: cada petición toma su propia conexión del pool
+    with crear_cliente(database_url=f"sqlite:///{tmp_path / 'ahorro.db'}") as client:
+        for i in range(5):
+            client.post("/retos/crear", params={"description": f"Reto {i}"}).raise_for_status()
+
+        respuestas = client.portal.call(_activar_a_la_vez, client.app, 8)
+
+        assert all(r.status_code == 200 for r in respuestas), [r.text for r in respuestas]
+        assert sum(r.json()["message"] == "Reto activado manualmente" for r in respuestas) == 1
+        assert client.portal.call(_retos_activos, client.app.state.estado) == 1
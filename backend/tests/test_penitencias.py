@@ -0,0 +1,30 @@
+import main
+
+
+async def _sembrar_penitencias(estado, *descripciones):
+    async with estado.SessionLocal() as db:
+        db.add_all([main.Penitencia(description=texto) for texto in descripciones])
+        await db.commit()
+
+
+def test_penitencias_leen_la_version_una_vez_por_peticion(client, contador_sql):
+    client.portal.call(_sembrar_penitencias, client.app.state.estado, "Lavar los platos", "Cocinar")
+
+    contador_sql.reiniciar()
+    assert client.get("/penitencias").json()["penitencias"] == ["Lavar los platos", "Cocinar"]
+    # Versiones y recarga del pool
+    assert len(contador_sql.sentencias) == 2
+
+    contador_sql.reiniciar()
+    assert client.get("/penitencias/random").json()["penitencia"] in ("Lavar los platos", "Cocinar")
+    # El pool está al día: solo la versión
+    assert len(contador_sql.sentencias) == 1
+
+
+def test_pool_se_recarga_al_cambiar_la_tabla(client):
+    estado = client.app.state.estado
+    client.portal.call(_sembrar_penitencias, estado, "Lavar los platos")
+    assert client.get("/penitencias/random").json()["penitencia"] == "Lavar los platos"
+
+    client.portal.call(_sembrar_penitencias, estado, "Cocinar")
+    assert client.get("/penitencias").json()["penitencias"] == ["Lavar los platos", "Cocinar"]
@@ -0,0 +1,8 @@
+def test_proximo_repetido_solo_lee_las_versiones(client, contador_sql):
+    client.post("/retos/crear", params={"description": "Reto de prueba"}).raise_for_status()
+    assert client.get("/retos/proximo").json()["retos_disponibles"] == 1
+
+    contador_sql.reiniciar()
+    assert client.get("/retos/proximo").json()["retos_disponibles"] == 1
+    assert len(contador_sql.sentencias) == 1
+    assert "data_versions" in contador_sql.sentencias[0]
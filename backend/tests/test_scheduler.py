@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+import pytest
+
+import main
+
+
+async def _registrar_activacion(estado, cuando, activation_type):
+    async with estado.SessionLocal() as db:
+        db.add(main.RetoSchedule(last_activation_date=cuando, activation_type=activation_type, activation_day=cuando.date()))
+        await db.commit()
+
+
+@pytest.fixture
+def activaciones(monkeypatch):
+    llamadas = []
+
+    async def registrar(activation_type=None, estado=None):
+        llamadas.append(activation_type)
+
+    monkeypatch.setattr(main, "SCHEDULER_MISFIRE_GRACE_HORAS", 24 * 365)
+    monkeypatch.setattr(main, "activar_reto_automatico", registrar)
+    return llamadas
+
+
+def test_activacion_perdida_se_recupera(client, activaciones):
+    client.portal.call(main.recuperar_activaciones, client.app.state.estado)
+    assert len(activaciones) == 1
+
+
+def test_activacion_manual_cubre_la_quincena(client, activaciones):
+    estado = client.app.state.estado
+    esperada, _ = main._activacion_esperada_anterior(main.datetime.now(main.colombia_tz))
+    # Alguien activó a mano un reto después del job perdido de las 00:01
+    manual = esperada.astimezone().replace(tzinfo=None) + timedelta(hours=10)
+    client.portal.call(_registrar_activacion, estado, manual, "manual")
+
+    client.portal.call(main.recuperar_activaciones, estado)
+    assert activaciones == []
@@ -0,0 +1,20 @@
+def test_series_con_ahorro_pequeno_no_desborda_la_proyeccion(client):
+    # Con 1.000 COP en un año el ritmo diario lleva la fecha estimada más allá de date.max
+    client.post("/ahorros", json={"user_id": 1, "monto_id": 1, "amount": 1000.0}).raise_for_status()
+
+    respuesta = client.get("/estadisticas/series")
+
+    assert respuesta.status_code == 200, respuesta.text
+    proyeccion = respuesta.json()["proyeccion"]
+    # Las metas más lejanas quedan sin fecha en lugar de desbordar
+    assert proyeccion[-1]["amount"] == 20_000_000
+    assert proyeccion[-1]["fecha_estimada"] is None
+
+
+def test_series_proyecta_fecha_con_ritmo_suficiente(client):
+    client.post("/ahorros", json={"user_id": 1, "monto_id": 1, "amount": 900_000.0}).raise_for_status()
+
+    proyeccion = client.get("/estadisticas/series").json()["proyeccion"]
+
+    assert proyeccion[0]["amount"] == 1_000_000
+    assert proyeccion[0]["fecha_estimada"] is not None
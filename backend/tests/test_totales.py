@@ -0,0 +1,41 @@
+from sqlalchemy import func, select
+
+import main
+
+
+async def _totales(estado):
+    """(ahorro_totales histórico por usuario, SUM(ahorros) por usuario)"""
+    async with estado.SessionLocal() as db:
+        acumulados = dict((await db.execute(
+            select(main.AhorroTotal.user_id, main.AhorroTotal.total)
+            .where(main.AhorroTotal.year == 0, main.AhorroTotal.month == 0)
+        )).all())
+        sumas = dict((await db.execute(
+            select(main.Ahorro.user_id, func.sum(main.Ahorro.amount)).group_by(main.Ahorro.user_id)
+        )).all())
+    return acumulados, sumas
+
+
+def _verificar(client):
+    acumulados, sumas = client.portal.call(_totales, client.app.state.estado)
+    assert {user_id: acumulados[user_id] for user_id in sumas} == sumas
+    assert acumulados[main.TOTAL_PAREJA] == sum(sumas.values())
+    assert client.get("/estadisticas").json()["total_general"] == sum(sumas.values())
+
+
+def test_totales_coinciden_con_ahorros_individuales(client):
+    for user_id, amount in ((1, 1000.0), (2, 2500.0), (1, 300.0)):
+        client.post("/ahorros", json={"user_id": user_id, "monto_id": 1, "amount": amount}).raise_for_status()
+    _verificar(client)
+
+
+def test_totales_coinciden_con_ahorros_masivos(client, monkeypatch):
+    # Varios lotes, con una fila inválida en medio que no debe sumar
+    monkeypatch.setattr(main, "BULK_CHUNK_SIZE", 4)
+    filas = [{"user_id": 1 + i % 2, "monto_id": 1, "amount": 100.0 * (i + 1)} for i in range(10)]
+    filas.insert(5, {"user_id": 1, "monto_id": 1, "amount": "no es un número"})
+
+    resultado = client.post("/ahorros/bulk", json=filas).json()
+
+    assert resultado["insertados"] == 10
+    _verificar(client)
@@ -0,0 +1,20 @@
+import sqlite3
+
+from conftest import crear_cliente
+
+
+def test_escritura_fuera_de_la_app_invalida_etag_y_cache(tmp_path):
+    ruta = tmp_path / "ahorro.db"
+    with crear_cliente(database_url=f"sqlite:///{ruta}") as client:
+        client.post("/init").raise_for_status()
+        antes = client.get("/retos/disponibles")
+        assert antes.json()["total"] == 0
+
+        # Como los scripts de carga de retos: SQL directo, sin pasar por la app
+        with sqlite3.connect(ruta) as conn:
+            conn.execute("INSERT INTO retos (description, tipo, completed_user1, completed_user2, penitencia_applied) VALUES ('Reto manual', 'general', 0, 0, 0)")
+
+        despues = client.get("/retos/disponibles", headers={"If-None-Match": antes.headers["etag"]})
+        assert despues.status_code == 200
+        assert despues.json()["total"] == 1
+        assert client.get("/retos/proximo").json()["retos_disponibles"] == 1
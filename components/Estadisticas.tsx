@@ -4,6 +4,7 @@ import { useEffect, useState } from "react";
 import axios from "axios";
 
 import API_URL from "@/lib/api";
+import { subscribeToEvent } from "@/lib/events";
 
 interface EstadisticasData {
   total_mes: number;
@@ -27,8 +28,7 @@ export default function Estadisticas({ userId }: { userId: number }) {
     };
 
     fetchEstadisticas();
-    const interval = setInterval(fetchEstadisticas);
-    return () => clearInterval(interval);
+    return subscribeToEvent("estadisticas", setEstadisticas, fetchEstadisticas);
   }, []);
 
   if (!estadisticas) {
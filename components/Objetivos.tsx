@@ -4,6 +4,7 @@ import { useEffect, useState } from "react";
 import axios from "axios";
 
 import API_URL from "@/lib/api";
+import { subscribeToEvent } from "@/lib/events";
 
 interface Objetivo {
   id: number;
@@ -17,8 +18,7 @@ export default function Objetivos({ userId }: { userId: number }) {
 
   useEffect(() => {
     fetchObjetivos();
-    const interval = setInterval(fetchObjetivos, 3000);
-    return () => clearInterval(interval);
+    return subscribeToEvent("objetivos", setObjetivos, fetchObjetivos);
   }, []);
 
   const fetchObjetivos = async () => {
@@ -7,6 +7,7 @@ import RetosIcon from "@/public/calendar-clock.svg";
 import TimeIcon from "@/public/timee-icon.svg";
 
 import API_URL from "@/lib/api";
+import { subscribeToEvent } from "@/lib/events";
 
 interface Reto {
   id: number;
@@ -38,20 +39,29 @@ export default function Retos({ userId }: { userId: number }) {
   const [nextRetoCountdown, setNextRetoCountdown] = useState<number>(0);
 
   useEffect(() => {
-    fetchRetos();
-    checkRetoActual();
-    fetchRetosDisponibles();
-    fetchProximoRetoInfo();
-    fetchUsers();
-
-    // Actualizar cada minuto
-    const interval = setInterval(() => {
+    const fetchTodo = () => {
       fetchRetos();
       checkRetoActual();
+      fetchRetosDisponibles();
       fetchProximoRetoInfo();
-    }, 60000);
+      fetchUsers();
+    };
+    fetchTodo();
 
-    return () => clearInterval(interval);
+    // Actualizar cuando el servidor notifica un cambio (y todo al reconectar o revalidar)
+    const unsubscribeReto = subscribeToEvent("reto", () => {
+      fetchRetos();
+      checkRetoActual();
+    }, fetchTodo);
+    const unsubscribeDisponibles = subscribeToEvent("retos_disponibles", (data) => {
+      setRetosDisponibles(data.total);
+      fetchProximoRetoInfo();
+    });
+
+    return () => {
+      unsubscribeReto();
+      unsubscribeDisponibles();
+    };
   }, []);
   const [isDark, setIsDark] = useState(false);
 
@@ -3,6 +3,7 @@
 import { useEffect, useState } from "react";
 import axios from "axios";
 import API_URL from "@/lib/api";
+import { subscribeToEvent } from "@/lib/events";
 
 interface Estadisticas {
   total_general: number;
@@ -26,6 +27,7 @@ export default function Termometro({ userId }: { userId: number }) {
     };
 
     fetchEstadisticas();
+    return subscribeToEvent("estadisticas", setEstadisticas, fetchEstadisticas);
   }, []);
 
   // Animación del líquido
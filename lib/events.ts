@@ -0,0 +1,84 @@
+import API_URL from "@/lib/api";
+
+type Listener = (data: any) => void;
+
+// Cada worker del backend solo envía los eventos de las escrituras que atiende él: con varios
+// workers esta revalidación trae los cambios hechos en los otros (casi siempre responde 304)
+const REVALIDATE_MS = 30_000;
+
+// Una sola conexión SSE compartida por todos los componentes de la pestaña
+let source: EventSource | null = null;
+let connected = false;
+let revalidateTimer: ReturnType<typeof setInterval> | null = null;
+let lastRefetch = Date.now();
+const listeners = new Map<string, Set<Listener>>();
+// Vuelven a pedir los datos completos de cada componente
+const refetchListeners = new Set<() => void>();
+
+const dispatch = (type: string) => (event: MessageEvent) => {
+  const data = JSON.parse(event.data);
+  listeners.get(type)?.forEach((listener) => listener(data));
+};
+
+const handlers = new Map<string, (event: MessageEvent) => void>();
+
+const refetchAll = () => {
+  lastRefetch = Date.now();
+  refetchListeners.forEach((refetch) => refetch());
+};
+
+// Los eventos publicados mientras la conexión estaba caída se pierden, y al reconectar
+// otro worker puede atender el stream: refetch vuelve a pedir los datos completos al
+// reconectar y cada REVALIDATE_MS mientras la pestaña está visible.
+export function subscribeToEvent(type: string, listener: Listener, refetch?: () => void) {
+  if (!source) {
+    source = new EventSource(`${API_URL}/events`);
+    connected = false;
+    source.addEventListener("open", () => {
+      if (connected) {
+        refetchAll();
+      }
+      connected = true;
+    });
+    revalidateTimer = setInterval(() => {
+      // Una reconexión reciente ya revalidó
+      if (document.visibilityState === "visible" && Date.now() - lastRefetch >= REVALIDATE_MS) {
+        refetchAll();
+      }
+    }, REVALIDATE_MS / 3);
+  }
+
+  if (!listeners.has(type)) {
+    listeners.set(type, new Set());
+    const handler = dispatch(type);
+    handlers.set(type, handler);
+    source.addEventListener(type, handler);
+  }
+  listeners.get(type)!.add(listener);
+  if (refetch) {
+    refetchListeners.add(refetch);
+  }
+
+  return () => {
+    if (refetch) {
+      refetchListeners.delete(refetch);
+    }
+    const set = listeners.get(type);
+    set?.delete(listener);
+
+    if (set && set.size === 0) {
+      source?.removeEventListener(type, handlers.get(type)!);
+      listeners.delete(type);
+      handlers.delete(type);
+    }
+
+    if (listeners.size === 0) {
+      source?.close();
+      source = null;
+      if (revalidateTimer) {
+        clearInterval(revalidateTimer);
+        revalidateTimer = null;
+      }
+    }
+  };
+}